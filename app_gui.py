@@ -2,42 +2,80 @@ import sys
 import os
 import re
 import subprocess
+import threading
+import time
+from collections import deque
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit,
-    QPushButton, QTextEdit, QComboBox, QFileDialog, QHBoxLayout, QSlider
+    QPushButton, QPlainTextEdit, QComboBox, QFileDialog, QHBoxLayout, QSlider,
+    QSpinBox, QTreeWidget, QTreeWidgetItem, QProgressBar
 )
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal, Qt
 from PyQt5.QtGui import QIcon
-from convert import convert_text_file_to_speech
 
+# Log view chỉ giữ LOG_MAX_LINES dòng cuối và được cập nhật theo lô mỗi LOG_FLUSH_MS
+LOG_MAX_LINES = 5000
+LOG_FLUSH_MS = 100
 
-class ConvertThread(QThread):
-    log_signal = pyqtSignal(str)
-    finished_signal = pyqtSignal(str)
+# startup_benchmark.py đặt biến này: app ghi thời điểm cửa sổ hiện lên vào file rồi thoát
+STARTUP_PROBE_ENV = "TTS_STARTUP_PROBE"
 
-    def __init__(self, input_file: str, voice: str, rate: str):
+
+def preload_convert():
+    """Import pipeline convert ở thread nền sau khi cửa sổ đã hiện, job đầu tiên khỏi phải chờ."""
+    import convert  # noqa: F401
+
+
+class JobSignals(QObject):
+    progress_signal = pyqtSignal(int, int, int, int)   # job_id, chương, số đoạn xong, tổng số đoạn
+    finished_signal = pyqtSignal(int, str)             # job_id, file output ("" nếu lỗi/hủy)
+
+
+class ConvertJob(QRunnable):
+    """
+    Một lần convert chạy trong QThreadPool. Log được đẩy vào `log_buffer`
+    (deque dùng chung, an toàn giữa các thread) thay vì gửi signal từng dòng.
+    """
+
+    def __init__(self, job_id: int, input_file: str, voice: str, rate: str, log_buffer: deque):
         super().__init__()
+        self.setAutoDelete(False)
+        self.job_id = job_id
         self.input_file = input_file
         self.voice = voice
         self.rate = rate
+        self.log_buffer = log_buffer
+        self.cancel_event = threading.Event()
+        self.signals = JobSignals()
 
     def run(self):
+        name = os.path.basename(self.input_file)
+
         def log_func(msg: str):
-            self.log_signal.emit(msg)
-
-        try:
-            output_file = convert_text_file_to_speech(
-                input_file=self.input_file,
-                voice=self.voice,
-                rate=self.rate,
-                log_func=log_func
-            )
-            if output_file:
-                self.finished_signal.emit(output_file)
-            else:
-                self.log_signal.emit("❌ Chuyển đổi thất bại.")
-        except Exception as e:
-            self.log_signal.emit(f"❌ Lỗi: {e}")
+            self.log_buffer.append(f"[{name}] {msg}")
+
+        def progress_func(index: int, done: int, total: int):
+            self.signals.progress_signal.emit(self.job_id, index, done, total)
+
+        output_file = ""
+        if not self.cancel_event.is_set():
+            try:
+                # Import muộn: pipeline (pydub, edge-tts, ...) chỉ nạp khi có job chạy
+                from convert import convert_text_file_to_speech
+
+                output_file = convert_text_file_to_speech(
+                    input_file=self.input_file,
+                    voice=self.voice,
+                    rate=self.rate,
+                    log_func=log_func,
+                    cancel_event=self.cancel_event,
+                    progress_func=progress_func
+                )
+                if not output_file and not self.cancel_event.is_set():
+                    log_func("❌ Chuyển đổi thất bại.")
+            except Exception as e:
+                log_func(f"❌ Lỗi: {e}")
+        self.signals.finished_signal.emit(self.job_id, output_file or "")
 
 
 class MainWindow(QWidget):
@@ -50,11 +88,11 @@ class MainWindow(QWidget):
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
 
-        self.resize(500, 550)
+        self.resize(640, 720)
         layout = QVBoxLayout()
 
         # File chọn
-        layout.addWidget(QLabel("📄 File .txt đầu vào:"))
+        layout.addWidget(QLabel("📄 File .txt đầu vào (chọn được nhiều file):"))
         file_layout = QHBoxLayout()
         self.file_input = QLineEdit()
         file_layout.addWidget(self.file_input)
@@ -88,14 +126,39 @@ class MainWindow(QWidget):
         self.speed_label = QLabel("Tốc độ: 0%")
         layout.addWidget(self.speed_label)
 
-        # Nút bắt đầu
-        self.btn_start = QPushButton("🚀 Bắt đầu chuyển đổi")
+        # Nút thêm vào hàng đợi + số job chạy song song
+        start_layout = QHBoxLayout()
+        self.btn_start = QPushButton("🚀 Thêm vào hàng đợi")
         self.btn_start.clicked.connect(self.start_convert)
-        layout.addWidget(self.btn_start)
+        start_layout.addWidget(self.btn_start)
+        start_layout.addWidget(QLabel("Song song:"))
+        self.jobs_spin = QSpinBox()
+        self.jobs_spin.setRange(1, 4)
+        self.jobs_spin.setValue(2)
+        start_layout.addWidget(self.jobs_spin)
+        layout.addLayout(start_layout)
+
+        # Hàng đợi: mỗi job một dòng, mỗi chương một dòng con có thanh tiến độ
+        layout.addWidget(QLabel("📋 Hàng đợi:"))
+        self.job_tree = QTreeWidget()
+        self.job_tree.setHeaderLabels(["File / chương", "Trạng thái", "Tiến độ"])
+        self.job_tree.setColumnWidth(0, 260)
+        self.job_tree.setColumnWidth(1, 110)
+        layout.addWidget(self.job_tree)
+
+        job_buttons = QHBoxLayout()
+        btn_cancel = QPushButton("⛔ Hủy job đã chọn")
+        btn_cancel.clicked.connect(self.cancel_selected)
+        job_buttons.addWidget(btn_cancel)
+        btn_clear = QPushButton("🧹 Xóa job đã xong")
+        btn_clear.clicked.connect(self.clear_finished)
+        job_buttons.addWidget(btn_clear)
+        layout.addLayout(job_buttons)
 
         # Log
-        self.log_output = QTextEdit()
+        self.log_output = QPlainTextEdit()
         self.log_output.setReadOnly(True)
+        self.log_output.setMaximumBlockCount(LOG_MAX_LINES)
         layout.addWidget(self.log_output)
 
         # Nút mở thư mục
@@ -106,41 +169,137 @@ class MainWindow(QWidget):
 
         self.setLayout(layout)
 
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(self.jobs_spin.value())
+        self.jobs_spin.valueChanged.connect(self.pool.setMaxThreadCount)
+        self.jobs = {}
+        self.next_job_id = 0
+
+        # Log từ các worker gom vào deque, timer đẩy lên giao diện theo lô
+        self.log_buffer = deque(maxlen=LOG_MAX_LINES)
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.flush_log)
+        self.log_timer.start(LOG_FLUSH_MS)
+
+        QTimer.singleShot(0, lambda: threading.Thread(target=preload_convert, daemon=True).start())
+
     def browse_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Chọn file .txt", "", "Text Files (*.txt)")
-        if file_path:
-            self.file_input.setText(file_path)
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Chọn file .txt", "", "Text Files (*.txt)")
+        if file_paths:
+            self.file_input.setText(";".join(file_paths))
 
     def update_speed_label(self):
         value = self.speed_slider.value()
         self.speed_label.setText(f"Tốc độ: {value:+d}%")
 
     def start_convert(self):
-        input_file = self.file_input.text().strip()
-        if not input_file or not os.path.exists(input_file):
+        input_files = [path.strip() for path in self.file_input.text().split(";") if path.strip()]
+        if not input_files or not all(os.path.exists(path) for path in input_files):
             self.append_log("❌ Vui lòng chọn file .txt hợp lệ.")
             return
 
         voice = self.voice_selector.currentText().split(" - ")[1]
         rate = f"{self.speed_slider.value()}%"
 
-        self.append_log(f"🔄 Bắt đầu chuyển đổi với tốc độ {rate}...")
-        self.btn_start.setEnabled(False)
-        self.btn_open_folder.setEnabled(False)
+        for input_file in input_files:
+            self.add_job(input_file, voice, rate)
+        self.append_log(f"🔄 Đã thêm {len(input_files)} file vào hàng đợi với tốc độ {rate}...")
+
+    def add_job(self, input_file: str, voice: str, rate: str):
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        job = ConvertJob(job_id, input_file, voice, rate, self.log_buffer)
+        job.signals.progress_signal.connect(self.update_progress)
+        job.signals.finished_signal.connect(self.convert_finished)
+
+        item = QTreeWidgetItem([os.path.basename(input_file), "⏳ Đang chờ", ""])
+        self.job_tree.addTopLevelItem(item)
+        bar = QProgressBar()
+        bar.setRange(0, 0)
+        self.job_tree.setItemWidget(item, 2, bar)
+        self.jobs[job_id] = {"job": job, "item": item, "bar": bar, "chapters": {}, "done": False}
+        self.pool.start(job)
+
+    def update_progress(self, job_id: int, index: int, done: int, total: int):
+        entry = self.jobs.get(job_id)
+        if not entry:
+            return
+        item = entry["item"]
+        if not entry["job"].cancel_event.is_set():
+            item.setText(1, "▶️ Đang chạy")
+
+        chapter = entry["chapters"].get(index)
+        if chapter is None:
+            child = QTreeWidgetItem([f"Chương {index + 1}", "", ""])
+            item.addChild(child)
+            chapter = {"item": child, "bar": QProgressBar(), "done": 0, "total": total}
+            self.job_tree.setItemWidget(child, 2, chapter["bar"])
+            entry["chapters"][index] = chapter
+        chapter.update(done=done, total=total)
+        chapter["bar"].setRange(0, max(total, 1))
+        chapter["bar"].setValue(done)
+
+        # Tiến độ cả job tính theo các chương đã bắt đầu
+        total_chunks = sum(c["total"] for c in entry["chapters"].values())
+        entry["bar"].setRange(0, max(total_chunks, 1))
+        entry["bar"].setValue(sum(c["done"] for c in entry["chapters"].values()))
 
-        self.thread = ConvertThread(input_file, voice, rate)
-        self.thread.log_signal.connect(self.append_log)
-        self.thread.finished_signal.connect(self.convert_finished)
-        self.thread.start()
+    def cancel_selected(self):
+        for item in self.job_tree.selectedItems():
+            while item.parent():
+                item = item.parent()
+            for entry in self.jobs.values():
+                if entry["item"] is item and not entry["done"]:
+                    entry["job"].cancel_event.set()
+                    if self.pool.tryTake(entry["job"]):
+                        # Job chưa chạy: bỏ khỏi hàng đợi luôn
+                        self.convert_finished(entry["job"].job_id, "")
+                    else:
+                        item.setText(1, "⏸️ Đang hủy...")
+
+    def clear_finished(self):
+        for job_id, entry in list(self.jobs.items()):
+            if entry["done"]:
+                index = self.job_tree.indexOfTopLevelItem(entry["item"])
+                self.job_tree.takeTopLevelItem(index)
+                del self.jobs[job_id]
+
+    def flush_log(self):
+        if not self.log_buffer:
+            return
+        lines = [self.log_buffer.popleft() for _ in range(len(self.log_buffer))]
+        self.log_output.appendPlainText("\n".join(lines))
 
     def append_log(self, msg: str):
-        self.log_output.append(msg)
+        self.log_buffer.append(msg)
 
-    def convert_finished(self, output_path: str):
-        self.append_log(f"\n✅ Đã tạo file audio: {output_path}")
-        self.btn_start.setEnabled(True)
-        self.output_folder = os.path.dirname(output_path)
-        self.btn_open_folder.setEnabled(True)
+    def convert_finished(self, job_id: int, output_path: str):
+        entry = self.jobs.get(job_id)
+        if not entry or entry["done"]:
+            return
+        entry["done"] = True
+        bar = entry["bar"]
+        if bar.maximum() == 0:
+            # Job chưa báo tiến độ lần nào: thanh đang ở chế độ "bận", chuyển về 0%
+            bar.setRange(0, 1)
+            bar.setValue(0)
+        if output_path:
+            entry["item"].setText(1, "✅ Xong")
+            bar.setValue(bar.maximum())
+            self.append_log(f"\n✅ Đã tạo file audio: {output_path}")
+            self.output_folder = os.path.dirname(output_path)
+            self.btn_open_folder.setEnabled(True)
+        elif entry["job"].cancel_event.is_set():
+            entry["item"].setText(1, "⛔ Đã hủy")
+        else:
+            entry["item"].setText(1, "❌ Lỗi")
+
+    def closeEvent(self, event):
+        for entry in self.jobs.values():
+            entry["job"].cancel_event.set()
+        self.pool.clear()
+        self.pool.waitForDone(5000)
+        super().closeEvent(event)
 
     def open_output_folder(self):
         if hasattr(self, "output_folder") and os.path.exists(self.output_folder):
@@ -156,4 +315,14 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+
+    probe_path = os.environ.get(STARTUP_PROBE_ENV)
+    if probe_path:
+        def write_probe():
+            with open(probe_path, "w", encoding="utf-8") as f:
+                f.write(repr(time.time()))
+            app.quit()
+
+        # singleShot(0) chạy khi event loop đã xử lý xong lần hiển thị đầu tiên
+        QTimer.singleShot(0, write_probe)
     sys.exit(app.exec_())
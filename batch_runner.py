@@ -0,0 +1,323 @@
+"""
+Chạy cả pipeline text → audio → phụ đề → video cho nhiều sách, không cần GUI.
+
+Ví dụ:
+    python batch_runner.py books/ --video loop.mp4 --music bg.mp3 --tts-jobs 2
+    python batch_runner.py "books/*.txt" --subtitles edge
+    python batch_runner.py books/ --subtitles align     # căn text gốc với audio, không cần Whisper
+
+Mỗi stage có pool riêng với giới hạn song song riêng, nên TTS (chờ mạng) của
+sách sau chạy chồng lên Whisper/ffmpeg (tốn CPU) của sách trước. Stage nào có
+hash nội dung input và tham số trùng với lần chạy trước (ghi trong
+`<sách>-build.json`) thì được bỏ qua.
+"""
+import argparse
+import glob
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from build_state import artifact_key, build_state_path, get_artifact, is_fresh, record_artifact
+from run_report import span, start_report, stop_report
+from silence_map import silence_map_path
+from subtitle_segmenter import SUBTITLE_WRITERS, subtitle_paths
+
+
+# File .txt do chính pipeline sinh ra, không phải sách đầu vào
+GENERATED_SUFFIXES = ("-cleaned.txt", "-chapters.txt")
+
+
+def find_books(pattern: str) -> list:
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.txt")
+    return sorted(
+        path for path in glob.glob(pattern)
+        if path.endswith(".txt") and not path.endswith(GENERATED_SUFFIXES)
+    )
+
+
+def build_stages(options: dict) -> list:
+    """
+    Trả về danh sách stage theo thứ tự phụ thuộc. Mỗi stage là dict
+    {"name", "inputs", "params", "outputs", "run"}; inputs/outputs/run nhận paths
+    của sách, `params` là các tùy chọn ảnh hưởng tới output (đưa vào hash).
+    """
+    tts_params = {
+        "voice": options["voice"],
+        "rate": options["rate"],
+        "subtitles": options["subtitles"],
+        "backend": options.get("backend", "edge"),
+    }
+    chapter_pause = options.get("chapter_pause")
+    if chapter_pause is not None:
+        tts_params["chapter_pause"] = chapter_pause
+    stages = [{
+        "name": "tts",
+        "inputs": lambda p: [p["text"]],
+        "params": tts_params,
+        "outputs": lambda p: ([p["audio"]] + ([p["srt"]] if options["subtitles"] == "edge" else [])
+                              + ([p["silence"]] if chapter_pause is not None else [])),
+        "run": lambda p, log: run_tts(p, options, log),
+    }]
+    if options["subtitles"] in ("whisper", "align"):
+        formats = options.get("subtitle_formats", ["srt"])
+        if options["subtitles"] == "align":
+            params = {"mode": "align"}
+        else:
+            params = {"model": options["model"]}
+        if formats != ["srt"]:
+            # Chỉ thêm khi khác mặc định để key của các lần build cũ không đổi
+            params["formats"] = formats
+        align = options["subtitles"] == "align"
+        stages.append({
+            "name": "subtitle",
+            "inputs": lambda p: [p["audio"], p["cleaned"]] if align else [p["audio"]],
+            "params": params,
+            "outputs": lambda p: subtitle_paths(p["srt"], formats),
+            "run": lambda p, log: (run_align if align else run_subtitle)(p, options, log),
+        })
+    if options["video"]:
+        stages.append({
+            "name": "video",
+            "inputs": lambda p: [p["audio"], options["video"], options["music"]],
+            "params": {
+                "music_volume": options["music_volume"],
+                "music_lufs": options.get("music_lufs", -16.0),
+                "profile": options.get("profile", "default"),
+            },
+            "outputs": lambda p: [p["video"]],
+            "run": lambda p, log: run_video(p, options, log),
+        })
+    return stages
+
+
+def run_tts(paths: dict, options: dict, log) -> bool:
+    from convert import convert_text_file_to_speech
+
+    return bool(convert_text_file_to_speech(
+        input_file=paths["text"],
+        output_dir=paths["output_dir"],
+        voice=options["voice"],
+        rate=options["rate"],
+        log_func=log,
+        concurrency=options["tts_concurrency"],
+        subtitles=options["subtitles"] == "edge",
+        backend=options.get("backend", "edge"),
+        keep_parts=options.get("keep_parts", True),
+        chapter_pause=options.get("chapter_pause"),
+    ))
+
+
+def run_subtitle(paths: dict, options: dict, log) -> bool:
+    from subtitle_generator import generate_subtitle, splice_subtitle
+
+    formats = options.get("subtitle_formats", ["srt"])
+
+    # Chỉ transcribe lại các chương đổi nội dung nếu SRT cũ được tạo từ cùng model
+    previous = get_artifact(paths["state"], "subtitle")
+    audio = get_artifact(paths["state"], "audio")
+    if (previous and audio and previous.get("model") == options["model"]
+            and previous.get("chapters") and os.path.exists(paths["srt"])):
+        if splice_subtitle(paths["audio"], paths["srt"], previous["chapters"], audio["chapters"],
+                           options["model"], log, formats):
+            return True
+    silence_map = paths["silence"] if os.path.exists(paths["silence"]) else None
+    generate_subtitle(paths["audio"], options["model"], log, options["whisper_workers"], formats, silence_map)
+    return os.path.exists(paths["srt"])
+
+
+def run_align(paths: dict, options: dict, log) -> bool:
+    from subtitle_generator import generate_aligned_subtitle
+
+    audio = get_artifact(paths["state"], "audio")
+    durations = [chapter["duration_ms"] for chapter in audio["chapters"]] if audio and audio.get("chapters") else None
+    generate_aligned_subtitle(paths["audio"], paths["cleaned"], durations, log, options.get("subtitle_formats", ["srt"]))
+    return os.path.exists(paths["srt"])
+
+
+def run_video(paths: dict, options: dict, log) -> bool:
+    from make_video_from_loop import make_video_loop_with_ffmpeg
+
+    make_video_loop_with_ffmpeg(
+        options["video"], paths["audio"], paths["video"], log,
+        music_path=options["music"], music_volume=options["music_volume"],
+        profile=options.get("profile", "default"),
+        music_lufs=options.get("music_lufs", -16.0)
+    )
+    return os.path.exists(paths["video"])
+
+
+def book_paths(text_file: str, output_dir: str = None) -> dict:
+    output_dir = output_dir or os.path.dirname(text_file)
+    base_name = os.path.splitext(os.path.basename(text_file))[0]
+    final = os.path.join(output_dir, f"{base_name}-final")
+    return {
+        "name": base_name,
+        "text": text_file,
+        "cleaned": os.path.join(output_dir, f"{base_name}-cleaned.txt"),
+        "output_dir": output_dir,
+        "audio": final + ".mp3",
+        "srt": final + ".srt",
+        "video": final + ".mp4",
+        "state": build_state_path(output_dir, base_name),
+        "silence": silence_map_path(output_dir, base_name),
+    }
+
+
+def run_batch(
+    text_files: list,
+    options: dict,
+    stage_jobs: dict = None,
+    force: bool = False,
+    log_func=print
+) -> dict:
+    """
+    Chạy pipeline cho từng sách; trả về {text_file: "done" | "failed:<stage>"}.
+
+    `stage_jobs` giới hạn số job chạy đồng thời của mỗi stage, vd. {"tts": 2, "subtitle": 1, "video": 1}.
+    """
+    stages = build_stages(options)
+    stage_jobs = stage_jobs or {}
+    pools = {
+        stage["name"]: ThreadPoolExecutor(max(1, stage_jobs.get(stage["name"], 1)), thread_name_prefix=stage["name"])
+        for stage in stages
+    }
+    results = {}
+    book_done = {}
+    lock = threading.Lock()
+
+    def run_stage(paths, stage, log):
+        outputs = stage["outputs"](paths)
+        key = artifact_key(stage["inputs"](paths), stage["params"])
+        if not force and is_fresh(paths["state"], stage["name"], key, outputs):
+            log(f"⏭️ Bỏ qua stage '{stage['name']}' (input và tham số không đổi)")
+            return True
+        log(f"▶️ Bắt đầu stage '{stage['name']}'")
+        with span(f"stage.{stage['name']}", book=paths["name"]) as stats:
+            ok = stage["run"](paths, log)
+            stats["ok"] = bool(ok)
+        if ok:
+            extra = dict(stage["params"])
+            audio = get_artifact(paths["state"], "audio")
+            if audio:
+                extra["chapters"] = audio.get("chapters")
+            record_artifact(paths["state"], stage["name"], key, outputs, **extra)
+        return ok
+
+    def schedule(text_file, paths, index, log):
+        if index == len(stages):
+            with lock:
+                results[text_file] = "done"
+            log("🎉 Hoàn thành tất cả stage")
+            book_done[text_file].set_result(True)
+            return
+        stage = stages[index]
+        future = pools[stage["name"]].submit(run_stage, paths, stage, log)
+
+        def on_done(f):
+            try:
+                ok = f.result()
+            except Exception as e:
+                log(f"❌ Lỗi ở stage '{stage['name']}': {e}")
+                ok = False
+            if ok:
+                schedule(text_file, paths, index + 1, log)
+            else:
+                with lock:
+                    results[text_file] = f"failed:{stage['name']}"
+                book_done[text_file].set_result(False)
+
+        future.add_done_callback(on_done)
+
+    log_func(f"📚 {len(text_files)} sách | Stage: {' → '.join(stage['name'] for stage in stages)}")
+    for text_file in text_files:
+        paths = book_paths(text_file, options.get("output_dir"))
+        os.makedirs(paths["output_dir"], exist_ok=True)
+
+        def log(msg, name=paths["name"]):
+            log_func(f"[{name}] {msg}")
+
+        book_done[text_file] = Future()
+        schedule(text_file, paths, 0, log)
+
+    wait(list(book_done.values()))
+    for pool in pools.values():
+        pool.shutdown()
+
+    failed = [f for f, status in results.items() if status != "done"]
+    log_func(f"📊 Xong {len(text_files) - len(failed)}/{len(text_files)} sách")
+    for text_file in failed:
+        log_func(f"❌ {os.path.basename(text_file)}: {results[text_file]}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy batch text → audio → phụ đề → video")
+    parser.add_argument("inputs", nargs="+", help="Thư mục hoặc glob các file .txt")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--backend", default="edge", help="TTS backend: edge, espeak, tone (xem tts_backends)")
+    parser.add_argument("--voice", default="vi-VN-NamMinhNeural")
+    parser.add_argument("--rate", default="0%")
+    parser.add_argument("--subtitles", choices=["none", "whisper", "edge", "align"], default="whisper",
+                        help="align: căn text đã làm sạch với audio (nhanh, đúng chữ), không chạy Whisper")
+    parser.add_argument("--model", default="base", help="Whisper model")
+    parser.add_argument("--subtitle-formats", default="srt",
+                        help=f"Định dạng phụ đề whisper/align, cách nhau bằng dấu phẩy ({', '.join(SUBTITLE_WRITERS)})")
+    parser.add_argument("--whisper-workers", type=int, default=0)
+    parser.add_argument("--video", default=None, help="Video nền để loop; bỏ trống để không render video")
+    parser.add_argument("--music", default=None)
+    parser.add_argument("--music-volume", type=int, default=30)
+    parser.add_argument("--music-lufs", type=float, default=-16.0, help="Loudness chuẩn hóa cho music nền")
+    parser.add_argument("--profile", default="default", help="Profile encode video (xem VIDEO_PROFILES)")
+    parser.add_argument("--tts-concurrency", type=int, default=4, help="Số chương tạo song song trong một sách")
+    parser.add_argument("--chapter-pause", type=float, default=None,
+                        help="Chuẩn hóa khoảng nghỉ giữa các chương (giây) và ghi silence map")
+    parser.add_argument("--no-parts", action="store_true", help="Ghi audio thẳng vào file cuối, không tạo file part")
+    parser.add_argument("--tts-jobs", type=int, default=2, help="Số sách chạy TTS cùng lúc")
+    parser.add_argument("--subtitle-jobs", type=int, default=1)
+    parser.add_argument("--video-jobs", type=int, default=1)
+    parser.add_argument("--force", action="store_true", help="Chạy lại mọi stage kể cả khi output đã mới nhất")
+    parser.add_argument("--report", default=None, help="Ghi báo cáo thời gian/bộ nhớ từng stage ra file JSON")
+    parser.add_argument("--prometheus", default=None, help="Ghi số liệu dạng text Prometheus ra file")
+    args = parser.parse_args(argv)
+
+    text_files = []
+    for pattern in args.inputs:
+        text_files.extend(f for f in find_books(pattern) if f not in text_files)
+    if not text_files:
+        print("❌ Không tìm thấy file .txt nào")
+        return 1
+
+    options = {
+        "output_dir": args.output_dir,
+        "backend": args.backend,
+        "voice": args.voice,
+        "rate": args.rate,
+        "subtitles": args.subtitles,
+        "model": args.model,
+        "subtitle_formats": [fmt.strip() for fmt in args.subtitle_formats.split(",") if fmt.strip()],
+        "whisper_workers": args.whisper_workers,
+        "video": args.video,
+        "music": args.music,
+        "music_volume": args.music_volume,
+        "music_lufs": args.music_lufs,
+        "profile": args.profile,
+        "tts_concurrency": args.tts_concurrency,
+        "keep_parts": not args.no_parts,
+        "chapter_pause": args.chapter_pause,
+    }
+    stage_jobs = {"tts": args.tts_jobs, "subtitle": args.subtitle_jobs, "video": args.video_jobs}
+    if args.report or args.prometheus:
+        start_report("batch")
+    results = run_batch(text_files, options, stage_jobs, args.force)
+    report = stop_report()
+    if report and args.report:
+        report.write_json(args.report)
+        print(f"📈 Đã ghi báo cáo: {args.report}")
+    if report and args.prometheus:
+        report.write_prometheus(args.prometheus)
+    return 0 if all(status == "done" for status in results.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
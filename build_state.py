@@ -0,0 +1,94 @@
+"""
+Theo dõi phụ thuộc của các file output (audio, phụ đề, video) theo hash nội dung.
+
+Mỗi sách có một file `<base>-build.json` ghi lại, cho từng artifact, key được
+hash từ nội dung input + tham số đã dùng để tạo ra nó. Chạy lại chỉ làm những
+artifact có key thay đổi hoặc output bị xóa/sửa; mtime không còn quyết định.
+"""
+import hashlib
+import json
+import os
+import threading
+
+_digest_cache = {}
+_state_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """sha256 nội dung file, cache theo (đường dẫn, mtime, size) nên file lớn chỉ hash một lần."""
+    if not path or not os.path.exists(path):
+        return ""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = _digest_cache[key] = h.hexdigest()
+    return digest
+
+
+def artifact_key(input_files: list, params: dict = None) -> str:
+    """Hash nội dung các file input cùng tham số (dict sắp xếp theo key)."""
+    h = hashlib.sha256()
+    for path in input_files:
+        h.update(file_digest(path).encode("ascii"))
+        h.update(b"\0")
+    h.update(json.dumps(params or {}, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def build_state_path(output_dir: str, base_name: str) -> str:
+    return os.path.join(output_dir, f"{base_name}-build.json")
+
+
+def output_stamp(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_state(state_path: str) -> dict:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if isinstance(state.get("artifacts"), dict):
+            return state
+    except (OSError, ValueError):
+        pass
+    return {"artifacts": {}}
+
+
+def get_artifact(state_path: str, name: str) -> dict:
+    return load_state(state_path)["artifacts"].get(name)
+
+
+def is_fresh(state_path: str, name: str, key: str, outputs: list) -> bool:
+    """
+    Artifact còn mới khi key trùng với lần tạo trước và các output vẫn đúng
+    như lúc ghi (size, mtime), tức chưa bị xóa hay sửa tay.
+    """
+    entry = get_artifact(state_path, name)
+    if not entry or entry.get("key") != key:
+        return False
+    stamps = entry.get("outputs", {})
+    for path in outputs:
+        if not os.path.exists(path) or stamps.get(os.path.abspath(path)) != output_stamp(path):
+            return False
+    return True
+
+
+def record_artifact(state_path: str, name: str, key: str, outputs: list, **extra):
+    """Ghi key và dấu (size, mtime) của output sau khi tạo xong; `extra` lưu kèm (vd. danh sách chương)."""
+    with _state_lock:
+        state = load_state(state_path)
+        state["artifacts"][name] = {
+            "key": key,
+            "outputs": {os.path.abspath(path): output_stamp(path) for path in outputs if os.path.exists(path)},
+            **extra,
+        }
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, state_path)
@@ -1,60 +1,640 @@
 import asyncio
-import edge_tts
-import unicodedata
-from pydub import AudioSegment
+import json
+import random
 import os
 import sys
 import re
+import threading
 import time
-import random
+from mp3_frames import read_mp3_info, scan_mp3, concat_mp3_files, codec_params
+from tts_cache import SynthesisCache, make_cache_key, DEFAULT_CACHE_DIR
+from tts_backends import TTSBackend, collect_stream, get_backend
+from text_cleaner import clean_file, iter_chapters, iter_clean_blocks
+from run_report import span
+from build_state import artifact_key, build_state_path, is_fresh, record_artifact
+from silence_map import analyze_parts, build_silence_map, merge_with_pacing, silence_map_path, write_silence_map
 
 if getattr(sys, 'frozen', False):
     base_path = sys._MEIPASS
     ffmpeg_path = os.path.join(base_path, "ffmpeg.exe")
 else:
     ffmpeg_path = "ffmpeg.exe"
-AudioSegment.converter = ffmpeg_path
+
+
+def audio_segment():
+    """
+    Import pydub khi thật sự cần giải mã audio (gộp file khác codec, đọc độ dài
+    file không phải MP3), để mở GUI/chạy convert không phải chờ import pydub.
+    """
+    from pydub import AudioSegment
+
+    AudioSegment.converter = ffmpeg_path
+    return AudioSegment
 
 
 def clean_for_tts(text: str) -> str:
-    text = unicodedata.normalize('NFKC', text)
-    text = re.sub(r"\*\*.*?\*\*", "", text)
-    text = re.sub(r"\*.*?\*", "", text)
-    text = re.sub(r"[\(\)\[\]\{\}<>\"""''']", "", text)
-    text = re.sub(r"Camera.*?\.", "", text)
-    text = re.sub(r"(?m)^---.*?---", "", text)
-    text = re.sub(r"[^a-zA-ZÀ-ỹ0-9\s\.,!?:;\-…#]", "", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+    return " ".join(iter_clean_blocks([text]))
 
 
 def split_text_by_chapters(text: str) -> list[tuple[str, str]]:
-    pattern = r"#\s*(.*?)\s*#"
-    matches = list(re.finditer(pattern, text))
-    parts = []
-
-    for i, match in enumerate(matches):
-        title = match.group(1).strip()
-        start = match.end()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-        content = text[start:end].strip()
-        if content:
-            parts.append((title, content))
-    return parts
+    return list(iter_chapters([text]))
 
 
-async def create_audio_from_text(text: str, output_path: str, voice: str = "vi-VN-NamMinhNeural", rate: str = "0%"):
+async def create_audio_from_text(
+    text: str,
+    output_path: str,
+    voice: str = "vi-VN-NamMinhNeural",
+    rate: str = "0%",
+    words_path: str = None,
+    backend: TTSBackend = None
+):
+    """
+    Tạo audio một đoạn text bằng `backend` (mặc định edge-tts). Nếu có
+    `words_path` và backend hỗ trợ, word boundary được lưu thành JSON
+    [[start_ms, end_ms, text], ...] để dựng phụ đề mà không cần Whisper.
+    """
     try:
-        communicate = edge_tts.Communicate(text=text, voice=voice, rate=rate)
-        await communicate.save(output_path)
+        await get_backend(backend or "edge").synthesize(text, output_path, voice, rate, words_path)
         return True
     except Exception as e:
         print(f"❌ Lỗi khi tạo audio: {e}")
         return False
 
 
-def merge_audio_files(output_file: str, audio_files: list):
+SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+CLAUSE_END_RE = re.compile(r"(?<=[,;:])\s+")
+
+
+def split_text_into_chunks(text: str, max_chars: int = 2000) -> list[str]:
+    """
+    Chia text chương thành các đoạn <= max_chars, ưu tiên cắt ở cuối câu,
+    sau đó ở dấu phẩy/chấm phẩy, cuối cùng mới cắt ở khoảng trắng.
+    """
+    pieces = []
+    for sentence in SENTENCE_END_RE.split(text.strip()):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in CLAUSE_END_RE.split(sentence):
+            while len(clause) > max_chars:
+                cut = clause.rfind(" ", 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                pieces.append(clause[:cut])
+                clause = clause[cut:].lstrip()
+            if clause:
+                pieces.append(clause)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def load_manifest(manifest_path: str) -> dict:
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get("chapters"), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"chapters": {}}
+
+
+def save_manifest(manifest_path: str, manifest: dict):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def join_mp3_chunks(chunk_paths: list, output_path: str):
+    """Nối các đoạn MP3 của edge-tts (cùng định dạng) bằng cách ghép byte."""
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for chunk_path in chunk_paths:
+            with open(chunk_path, "rb") as f:
+                while True:
+                    block = f.read(1024 * 1024)
+                    if not block:
+                        break
+                    out.write(block)
+    os.replace(tmp_path, output_path)
+
+
+def load_words(words_path: str) -> list:
+    with open(words_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def join_word_chunks(words_paths: list, chunk_paths: list, output_path: str):
+    """Gộp word boundary của các đoạn, dịch thời gian theo độ dài MP3 của từng đoạn."""
+    words = []
+    offset_ms = 0.0
+    for words_path, chunk_path in zip(words_paths, chunk_paths):
+        chunk_words = load_words(words_path)
+        for start, end, text in chunk_words:
+            words.append([start + offset_ms, end + offset_ms, text])
+        info = read_mp3_info(chunk_path)
+        if info:
+            offset_ms += info["duration_ms"]
+        elif chunk_words:
+            offset_ms += chunk_words[-1][1]
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(words, f, ensure_ascii=False)
+
+
+class TokenBucket:
+    """
+    Giới hạn số request gửi đi mỗi giây, cho phép burst tối đa `capacity`.
+
+    Dùng threading.Lock (không phải asyncio.Lock) để nhiều job, mỗi job một
+    event loop trong thread riêng, cùng chia một bucket.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def configure(self, rate: float, capacity: float = 1.0):
+        with self.lock:
+            self.rate = rate
+            self.capacity = max(capacity, 1.0)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def try_acquire(self) -> float:
+        """Lấy một token; trả về 0 nếu được, không thì số giây cần chờ."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def shared_bucket(backend_name: str, rate: float, capacity: float = 1.0) -> TokenBucket:
+    """
+    Một TokenBucket cho mỗi backend trong cả process: GUI và batch_runner chạy
+    nhiều sách song song, tổng số request tới backend vẫn không vượt `rate`.
+    Cấu hình của lần gọi sau cùng được áp dụng.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(backend_name)
+        if bucket is None:
+            bucket = _buckets[backend_name] = TokenBucket(rate, capacity)
+        else:
+            bucket.configure(rate, capacity)
+        return bucket
+
+
+async def synthesize_with_retry(
+    text: str,
+    output_path: str,
+    voice: str,
+    rate: str,
+    bucket: "TokenBucket" = None,
+    max_retries: int = 3,
+    backoff: float = 2.0,
+    log_func=print,
+    words_path: str = None,
+    backend: TTSBackend = None
+) -> bool:
+    for attempt in range(max_retries + 1):
+        if bucket:
+            await bucket.acquire()
+        if await create_audio_from_text(text, output_path, voice, rate, words_path, backend):
+            return True
+        if attempt < max_retries:
+            delay = backoff * 2 ** attempt + random.uniform(0, 1)
+            log_func(f"🔁 Thử lại sau {delay:.1f} giây ({attempt + 1}/{max_retries})...")
+            await asyncio.sleep(delay)
+    return False
+
+
+async def synthesize_chapter(
+    text: str,
+    output_path: str,
+    voice: str,
+    rate: str,
+    bucket: "TokenBucket" = None,
+    manifest: dict = None,
+    on_progress=None,
+    max_chunk_chars: int = 2000,
+    max_retries: int = 3,
+    log_func=print,
+    cache: SynthesisCache = None,
+    with_words: bool = False,
+    backend: TTSBackend = None,
+    cancel_event: threading.Event = None
+) -> dict:
+    """
+    Tạo audio một chương theo từng đoạn nhỏ, có retry.
+
+    Tiến độ được ghi vào `manifest["chapters"]` (gọi `on_progress()` sau mỗi
+    đoạn để lưu xuống đĩa), nên lần chạy sau sẽ tiếp tục từ đoạn đã xong cuối cùng.
+    Trả về entry của chương trong manifest (có thông tin frame MP3 ở key "mp3"),
+    hoặc None nếu tạo thất bại. Với `with_words`, word boundary của chương được
+    ghi ra `<part>.words.json` cạnh file audio. Khi `cancel_event` được set,
+    chương dừng trước đoạn kế tiếp (trả về None) và lần chạy sau tiếp tục từ đó.
+    """
+    name = os.path.basename(output_path)
+    backend = get_backend(backend or "edge")
+    key = make_cache_key(text, voice, rate, *backend.cache_tag())
+    chunks = split_text_into_chunks(text, max_chunk_chars)
+    if manifest is None:
+        manifest = {"chapters": {}}
+    entry = manifest["chapters"].get(name)
+    if not entry or entry.get("key") != key or entry.get("chunks") != len(chunks):
+        entry = {"key": key, "chunks": len(chunks), "done": 0, "complete": False}
+        manifest["chapters"][name] = entry
+
+    stem = os.path.splitext(output_path)[0]
+    words_path = f"{stem}.words.json" if with_words else None
+
+    def has_words(path):
+        return path is None or os.path.exists(path)
+
+    if entry["complete"] and os.path.exists(output_path) and has_words(words_path):
+        pass
+    elif (cache and cache.get(key, output_path)
+            and (not with_words or cache.get(key, words_path, suffix=".words.json"))):
+        log_func(f"♻️ Dùng lại từ cache: {name}")
+        entry.update(done=len(chunks), complete=True, mp3=None)
+    else:
+        chunk_paths = [f"{stem}.chunk-{i:03d}.mp3" for i in range(1, len(chunks) + 1)]
+        chunk_words = [f"{stem}.chunk-{i:03d}.words.json" if with_words else None
+                       for i in range(1, len(chunks) + 1)]
+        done = 0
+        while (done < entry["done"] and os.path.exists(chunk_paths[done])
+               and has_words(chunk_words[done])):
+            done += 1
+        if done:
+            log_func(f"⏯️ Tiếp tục {name} từ đoạn {done + 1}/{len(chunks)}")
+
+        for i in range(done, len(chunks)):
+            if cancel_event and cancel_event.is_set():
+                return None
+            ok = await synthesize_with_retry(
+                chunks[i], chunk_paths[i], voice, rate, bucket, max_retries,
+                log_func=log_func, words_path=chunk_words[i], backend=backend
+            )
+            entry["done"] = i + 1 if ok else i
+            if on_progress:
+                on_progress()
+            if not ok:
+                return None
+
+        if with_words:
+            join_word_chunks(chunk_words, chunk_paths, words_path)
+            for chunk_words_path in chunk_words:
+                os.remove(chunk_words_path)
+        join_mp3_chunks(chunk_paths, output_path)
+        for chunk_path in chunk_paths:
+            os.remove(chunk_path)
+        entry.update(complete=True, mp3=None)
+        if cache:
+            cache.put(key, output_path)
+            if with_words:
+                cache.put(key, words_path, suffix=".words.json")
+
+    # Đọc header frame một lần khi chương xong; merge và chapter file dùng lại, không giải mã
+    # (manifest cũ chưa có bitrate thì đọc lại)
+    if not entry.get("mp3") or "bitrate" not in entry["mp3"]:
+        entry["mp3"] = read_mp3_info(output_path)
+    if on_progress:
+        on_progress()
+    return entry
+
+
+async def synthesize_chapters(
+    jobs: list,
+    voice: str = "vi-VN-NamMinhNeural",
+    rate: str = "0%",
+    concurrency: int = 4,
+    requests_per_second: float = 1.0,
+    log_func=print,
+    cache: SynthesisCache = None,
+    manifest_path: str = None,
+    max_chunk_chars: int = 2000,
+    max_retries: int = 3,
+    with_words: bool = False,
+    backend: TTSBackend = None,
+    cancel_event: threading.Event = None,
+    progress_func=None
+) -> list:
+    """
+    Tạo audio cho nhiều chương song song trong một event loop.
+
+    `jobs` là danh sách (title, text, output_path) theo thứ tự chương; kết quả
+    trả về là list entry manifest (None nếu lỗi) cùng thứ tự, nên file
+    -part-NNN.mp3 vẫn khớp với chương.
+    Chương nào đã có trong `cache` thì copy ra luôn, không gọi backend TTS.
+    Nếu có `manifest_path`, tiến độ từng đoạn được lưu lại để chạy tiếp khi bị ngắt.
+    `requests_per_second=None` để không giới hạn tốc độ (backend chạy local).
+    `progress_func(index, done, total)` được gọi sau mỗi đoạn của chương thứ `index`.
+    """
+    backend = get_backend(backend or "edge")
+    bucket = shared_bucket(backend.name, requests_per_second, capacity=concurrency) if requests_per_second else None
+    manifest = load_manifest(manifest_path) if manifest_path else {"chapters": {}}
+
+    def on_progress():
+        if manifest_path:
+            save_manifest(manifest_path, manifest)
+
+    queue = asyncio.Queue()
+    for index, job in enumerate(jobs):
+        queue.put_nowait((index, job))
+    results = [None] * len(jobs)
+
+    async def worker():
+        while True:
+            if cancel_event and cancel_event.is_set():
+                return
+            try:
+                index, (title, text, output_path) = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            log_func(f"\n🟡 Đang xử lý chương {index + 1}/{len(jobs)}: {title}")
+
+            def on_chapter_progress(index=index, name=os.path.basename(output_path)):
+                on_progress()
+                entry = manifest["chapters"].get(name)
+                if progress_func and entry:
+                    progress_func(index, entry["done"], entry["chunks"])
+
+            with span("tts.chapter", chapter=index + 1, chars=len(text), backend=backend.name) as stats:
+                results[index] = await synthesize_chapter(
+                    text, output_path, voice, rate, bucket, manifest, on_chapter_progress,
+                    max_chunk_chars, max_retries, log_func, cache, with_words, backend, cancel_event
+                )
+                stats["ok"] = bool(results[index])
+            if results[index]:
+                log_func(f"✅ Đã tạo: {os.path.basename(output_path)}")
+            elif cancel_event and cancel_event.is_set():
+                log_func(f"⏸️ Dừng chương {index + 1}: {title}")
+            else:
+                log_func(f"❌ Lỗi tạo chương {index + 1}: {title}")
+
+    workers = max(1, min(concurrency, len(jobs)))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return results
+
+
+async def stream_with_retry(
+    text: str,
+    voice: str,
+    rate: str,
+    bucket: "TokenBucket" = None,
+    max_retries: int = 3,
+    backoff: float = 2.0,
+    log_func=print,
+    backend: TTSBackend = None
+):
+    """Như synthesize_with_retry nhưng giữ audio trong bộ nhớ; trả về (bytes, words) hoặc None."""
+    for attempt in range(max_retries + 1):
+        if bucket:
+            await bucket.acquire()
+        try:
+            return await collect_stream(backend, text, voice, rate)
+        except Exception as e:
+            log_func(f"❌ Lỗi khi tạo audio: {e}")
+        if attempt < max_retries:
+            delay = backoff * 2 ** attempt + random.uniform(0, 1)
+            log_func(f"🔁 Thử lại sau {delay:.1f} giây ({attempt + 1}/{max_retries})...")
+            await asyncio.sleep(delay)
+    return None
+
+
+async def stream_chapters_to_file(
+    chapters: list,
+    output_path: str,
+    voice: str = "vi-VN-NamMinhNeural",
+    rate: str = "0%",
+    concurrency: int = 4,
+    requests_per_second: float = 1.0,
+    log_func=print,
+    max_chunk_chars: int = 2000,
+    max_retries: int = 3,
+    backend: TTSBackend = None,
+    cancel_event: threading.Event = None,
+    progress_func=None
+) -> list:
+    """
+    Tạo audio mọi chương và ghi thẳng vào một file MP3, không có file part.
+
+    `chapters` là list (title, text). Các đoạn được tổng hợp song song (tối đa
+    `concurrency` request, chạy trước writer không quá 2*concurrency đoạn để
+    giới hạn bộ nhớ) nhưng chỉ một writer ghi theo đúng thứ tự. Độ dài từng
+    chương được cộng dồn từ header frame ngay khi byte tới.
+    Trả về list {"duration_ms", "words"} theo chương (words tính từ đầu
+    chương), hoặc None nếu có đoạn lỗi hoặc bị hủy qua `cancel_event`
+    (file output không bị ghi đè). `progress_func` như ở synthesize_chapters.
+    """
+    backend = get_backend(backend or "edge")
+    bucket = shared_bucket(backend.name, requests_per_second, capacity=concurrency) if requests_per_second else None
+    chunks = [
+        (index, text)
+        for index, (_, content) in enumerate(chapters)
+        for text in split_text_into_chunks(content, max_chunk_chars)
+    ]
+    last_chunk = {index: i for i, (index, _) in enumerate(chunks)}
+    chapter_chunks = {index: sum(1 for chunk_index, _ in chunks if chunk_index == index) for index in last_chunk}
+    written = dict.fromkeys(last_chunk, 0)
+    loop = asyncio.get_running_loop()
+    futures = [loop.create_future() for _ in chunks]
+    limit = asyncio.Semaphore(concurrency)
+    window = asyncio.Semaphore(concurrency * 2)
+
+    async def run_chunk(i, text):
+        async with limit:
+            futures[i].set_result(await stream_with_retry(
+                text, voice, rate, bucket, max_retries, log_func=log_func, backend=backend
+            ))
+
+    async def schedule():
+        tasks = []
+        try:
+            for i, (_, text) in enumerate(chunks):
+                await window.acquire()
+                tasks.append(asyncio.create_task(run_chunk(i, text)))
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    results = [{"duration_ms": 0.0, "words": []} for _ in chapters]
+    params = None
+    scheduler = asyncio.create_task(schedule())
+    tmp_path = output_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            for i, (index, _) in enumerate(chunks):
+                if cancel_event and cancel_event.is_set():
+                    return None
+                result = await futures[i]
+                window.release()
+                if result is None:
+                    log_func(f"❌ Lỗi tạo chương {index + 1}: {chapters[index][0]}")
+                    return None
+                data, words = result
+                info = scan_mp3(data)
+                if info is None or (params and codec_params(info) != params):
+                    log_func(f"❌ Audio của chương {index + 1} không đọc được hoặc khác định dạng")
+                    return None
+                params = codec_params(info)
+                out.write(data[info["audio_start"]:info["audio_end"]])
+
+                chapter = results[index]
+                chapter["words"].extend(
+                    [start + chapter["duration_ms"], end + chapter["duration_ms"], text] for start, end, text in words
+                )
+                chapter["duration_ms"] += info["duration_ms"]
+                written[index] += 1
+                if progress_func:
+                    progress_func(index, written[index], chapter_chunks[index])
+                if last_chunk[index] == i:
+                    log_func(f"✅ Đã ghi chương {index + 1}/{len(chapters)}: {chapters[index][0]}")
+        os.replace(tmp_path, output_path)
+        return results
+    finally:
+        scheduler.cancel()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def format_cue_time(ms: float) -> str:
+    """CUE dùng mm:ss:ff với 75 frame mỗi giây."""
+    total_frames = int(round(ms * 75 / 1000))
+    minutes, rest = divmod(total_frames, 75 * 60)
+    seconds, frames = divmod(rest, 75)
+    return f"{minutes:02d}:{seconds:02d}:{frames:02d}"
+
+
+def chapter_offsets(durations_ms: list) -> list:
+    starts = []
+    current_time_ms = 0
+    for duration in durations_ms:
+        starts.append(current_time_ms)
+        current_time_ms += duration
+    return starts
+
+
+def write_chapter_files(
+    output_dir: str,
+    base_name: str,
+    final_audio: str,
+    chapter_titles: list,
+    durations_ms: list,
+    log_func=print
+):
+    """Ghi -chapters.txt, -chapters.ffmetadata và .cue từ độ dài các part, không cần giải mã audio."""
+    starts = chapter_offsets(durations_ms)
+
+    chapter_file = os.path.join(output_dir, f"{base_name}-chapters.txt")
+    with open(chapter_file, "w", encoding="utf-8") as f:
+        for title, t in zip(chapter_titles, starts):
+            minutes = int(t // 60000)
+            seconds = int((t % 60000) / 1000)
+            f.write(f"{minutes:02}:{seconds:02} {title}\n")
+    log_func(f"📖 Đã tạo chapter file: {chapter_file}")
+
+    def escape_ffmetadata(value: str) -> str:
+        return re.sub(r"([=;#\\\n])", r"\\\1", value)
+
+    metadata_file = os.path.join(output_dir, f"{base_name}-chapters.ffmetadata")
+    with open(metadata_file, "w", encoding="utf-8") as f:
+        f.write(";FFMETADATA1\n")
+        f.write(f"title={escape_ffmetadata(base_name)}\n")
+        for title, start, duration in zip(chapter_titles, starts, durations_ms):
+            f.write("\n[CHAPTER]\nTIMEBASE=1/1000\n")
+            f.write(f"START={int(start)}\nEND={int(start + duration)}\n")
+            f.write(f"title={escape_ffmetadata(title)}\n")
+    log_func(f"📖 Đã tạo ffmetadata: {metadata_file}")
+
+    cue_file = os.path.join(output_dir, f"{base_name}.cue")
+    with open(cue_file, "w", encoding="utf-8") as f:
+        f.write(f'TITLE "{base_name}"\n')
+        f.write(f'FILE "{os.path.basename(final_audio)}" MP3\n')
+        for i, (title, start) in enumerate(zip(chapter_titles, starts), 1):
+            f.write(f"  TRACK {i:02d} AUDIO\n")
+            f.write(f'    TITLE "{title.replace(chr(34), chr(39))}"\n')
+            f.write(f"    INDEX 01 {format_cue_time(start)}\n")
+    log_func(f"📖 Đã tạo CUE: {cue_file}")
+
+
+def write_subtitles_from_words(
+    srt_file: str,
+    chapter_words: list,
+    durations_ms: list,
+    log_func=print,
+    shifts_ms: list = None
+):
+    """
+    Dựng SRT cho file gộp từ word boundary của từng chương, dịch theo vị trí chương.
+    `chapter_words` là list (mỗi chương một list [start_ms, end_ms, text]) hoặc list đường dẫn .words.json.
+    `shifts_ms` bù cho khoảng lặng đã cắt/chèn ở đầu từng chương (xem silence_map.merge_with_pacing).
+    """
+    from subtitle_generator import create_srt_from_words
+
+    words = []
+    starts = chapter_offsets(durations_ms)
+    if shifts_ms:
+        starts = [start + shift for start, shift in zip(starts, shifts_ms)]
+    for chapter, start in zip(chapter_words, starts):
+        for word_start, word_end, text in (load_words(chapter) if isinstance(chapter, str) else chapter):
+            words.append({
+                "word": text,
+                "start": (start + word_start) / 1000,
+                "end": (start + word_end) / 1000,
+            })
+    create_srt_from_words(words, srt_file, log_func=log_func)
+
+
+def merge_audio_files(output_file: str, audio_files: list, streaming: bool = True, infos: list = None):
     print(f"\n🔄 Đang gộp {len(audio_files)} file audio...")
+    if streaming:
+        known = dict(zip(audio_files, infos or []))
+        existing = [f for f in audio_files if os.path.exists(f)]
+        infos = [known.get(f) or read_mp3_info(f) for f in existing]
+        if existing and all(infos) and len({codec_params(i) for i in infos}) == 1:
+            for audio_file in audio_files:
+                if audio_file not in existing:
+                    print(f"⚠️ Không tìm thấy: {audio_file}")
+            concat_mp3_files(existing, output_file, infos)
+            print(f"✅ Đã tạo file gộp (nối frame, không encode lại): {output_file}")
+            print(f"📊 Đã gộp {len(existing)}/{len(audio_files)} file thành công")
+            return True
+        if existing:
+            print("⚠️ Có file khác thông số codec hoặc không đọc được frame MP3, chuyển sang giải mã và encode lại")
+
+    AudioSegment = audio_segment()
     merged = AudioSegment.empty()
     successful_files = 0
 
@@ -85,8 +665,33 @@ def convert_text_file_to_speech(
     output_dir: str = None,
     voice: str = "vi-VN-NamMinhNeural",
     rate: str = "0%",
-    log_func=print
+    log_func=print,
+    concurrency: int = 4,
+    requests_per_second: float = 1.0,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    cache_max_mb: int = 2048,
+    max_chunk_chars: int = 2000,
+    max_retries: int = 3,
+    subtitles: bool = False,
+    backend="edge",
+    keep_parts: bool = True,
+    cancel_event: threading.Event = None,
+    progress_func=None,
+    chapter_pause: float = None
 ) -> str:
+    """
+    `chapter_pause` (giây): phân tích khoảng lặng của các part, cắt/chèn im lặng
+    để mọi chỗ nối chương nghỉ đúng chừng đó và ghi silence map -silence.json
+    cho stage phụ đề (xem silence_map.py). None = nối nguyên các part.
+
+    `keep_parts=False` (backend phải hỗ trợ streaming) ghi audio thẳng vào
+    -final.mp3 mà không tạo file -part-NNN.mp3; chế độ này không dùng cache
+    và không chạy tiếp được từ giữa chừng.
+
+    Set `cancel_event` (threading.Event) từ thread khác để dừng sau đoạn
+    đang tạo; tiến độ đã lưu nên chạy lại sẽ tiếp tục. `progress_func(index,
+    done, total)` nhận tiến độ theo đoạn của từng chương.
+    """
     if not os.path.exists(input_file):
         log_func(f"❌ Không tìm thấy file: {input_file}")
         return ""
@@ -101,26 +706,23 @@ def convert_text_file_to_speech(
     log_func(f"🎤 Giọng đọc: {voice} | Tốc độ: {rate}")
     log_func(f"📁 Thư mục output: {output_dir}")
 
+    # Làm sạch, ghi -cleaned.txt và tách chương trong một lượt đọc file
+    cleaned_file = os.path.join(output_dir, f"{base_name}-cleaned.txt")
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            original_text = f.read()
+        with span("clean") as stats:
+            chapter_parts, cleaned_length = clean_file(input_file, cleaned_file)
+            stats["chars"] = cleaned_length
     except Exception as e:
         log_func(f"❌ Lỗi khi đọc file: {e}")
         return ""
 
-    if not original_text.strip():
+    if not cleaned_length:
         log_func("❌ File text rỗng")
         return ""
 
-    cleaned_text = clean_for_tts(original_text)
-    log_func(f"🧹 Độ dài text sau làm sạch: {len(cleaned_text)} ký tự")
-
-    cleaned_file = os.path.join(output_dir, f"{base_name}-cleaned.txt")
-    with open(cleaned_file, 'w', encoding='utf-8') as f:
-        f.write(cleaned_text)
+    log_func(f"🧹 Độ dài text sau làm sạch: {cleaned_length} ký tự")
     log_func(f"✅ Đã lưu text làm sạch: {cleaned_file}")
 
-    chapter_parts = split_text_by_chapters(cleaned_text)
     if not chapter_parts:
         log_func("❌ Không phát hiện chương nào. Đảm bảo mỗi chương bắt đầu bằng dòng: # tiêu đề #")
         return ""
@@ -129,48 +731,183 @@ def convert_text_file_to_speech(
     chapter_titles = [title for title, _ in chapter_parts]
     log_func(f"📚 Đã phát hiện {len(chapter_titles)} chương.")
 
-    audio_files = []
-    for i, part in enumerate(text_parts, 1):
-        log_func(f"\n🟡 Đang xử lý chương {i}/{len(text_parts)}: {chapter_titles[i-1]}")
-        part_audio = os.path.join(output_dir, f"{base_name}-part-{i:03d}.mp3")
-        success = asyncio.run(create_audio_from_text(part, part_audio, voice, rate))
-        if success:
-            log_func(f"✅ Đã tạo: {os.path.basename(part_audio)}")
-            audio_files.append(part_audio)
-        else:
-            log_func(f"❌ Lỗi tạo chương {i}")
+    jobs = [
+        (chapter_titles[i - 1], part, os.path.join(output_dir, f"{base_name}-part-{i:03d}.mp3"))
+        for i, part in enumerate(text_parts, 1)
+    ]
+    manifest_path = os.path.join(output_dir, f"{base_name}-manifest.json")
+    cache = SynthesisCache(cache_dir, cache_max_mb * 1024 * 1024) if cache_dir else None
 
-        delay = random.uniform(1.5, 3.0)
-        log_func(f"⏳ Chờ {delay:.1f} giây để tránh spam...")
-        time.sleep(delay)
+    # Điều chỉnh theo khả năng của backend
+    backend = get_backend(backend)
+    if subtitles and not backend.word_boundaries:
+        log_func(f"⚠️ Backend '{backend.name}' không có word boundary, bỏ qua tạo phụ đề")
+        subtitles = False
+    max_chunk_chars = min(max_chunk_chars, backend.max_request_chars)
+    concurrency = min(concurrency, backend.max_concurrency)
+    if backend.requests_per_second is None:
+        requests_per_second = None
+    limit = f"{requests_per_second:g} request/giây" if requests_per_second else "không"
+    log_func(f"⚙️ Backend: {backend.name} | Song song: {concurrency} luồng | Giới hạn: {limit}")
 
-    if not audio_files:
-        log_func("❌ Không tạo được file audio nào")
+    if not keep_parts:
+        if backend.streaming:
+            if chapter_pause is not None:
+                log_func("⚠️ Chế độ không tạo file part không chuẩn hóa được khoảng nghỉ giữa chương")
+            return convert_streaming(
+                chapter_parts, output_dir, base_name, voice, rate, log_func, concurrency,
+                requests_per_second, max_chunk_chars, max_retries, subtitles, backend,
+                cancel_event, progress_func
+            )
+        log_func(f"⚠️ Backend '{backend.name}' không hỗ trợ streaming, vẫn tạo file part")
+
+    with span("tts", chars=sum(len(part) for part in text_parts), chapters=len(jobs), backend=backend.name):
+        results = asyncio.run(synthesize_chapters(
+            jobs, voice, rate, concurrency, requests_per_second, log_func, cache,
+            manifest_path, max_chunk_chars, max_retries, subtitles, backend,
+            cancel_event, progress_func
+        ))
+    if cache:
+        log_func(cache.stats())
+
+    if cancel_event and cancel_event.is_set():
+        log_func(f"⛔ Đã hủy. Chạy lại để tiếp tục từ tiến độ đã lưu trong {os.path.basename(manifest_path)}")
         return ""
+    failed = [i for i, entry in enumerate(results, 1) if not entry]
+    if failed:
+        log_func(f"❌ {len(failed)} chương lỗi: {', '.join(str(i) for i in failed)}")
+        log_func(f"⏯️ Chạy lại để tiếp tục từ tiến độ đã lưu trong {os.path.basename(manifest_path)}")
+        return ""
+    audio_files = [path for _, _, path in jobs]
+    infos = [entry.get("mp3") for entry in results]
 
     final_audio = os.path.join(output_dir, f"{base_name}-final.mp3")
-    if merge_audio_files(final_audio, audio_files):
+    srt_file = os.path.splitext(final_audio)[0] + ".srt"
+    silence_file = silence_map_path(output_dir, base_name)
+    outputs = [final_audio] + ([srt_file] if subtitles else []) + ([silence_file] if chapter_pause is not None else [])
+
+    # Các chương không đổi (cùng text/voice/rate) thì file gộp, chapter file và SRT cũng không đổi
+    state_path = build_state_path(output_dir, base_name)
+    audio_params = {
+        "chapters": [[title, entry["key"]] for title, entry in zip(chapter_titles, results)],
+        "subtitles": subtitles,
+    }
+    if chapter_pause is not None:
+        # Chỉ thêm khi bật để key của các lần build cũ không đổi
+        audio_params["chapter_pause"] = chapter_pause
+    audio_key = artifact_key([], audio_params)
+    if is_fresh(state_path, "audio", audio_key, outputs):
+        log_func(f"⏭️ Không có chương nào thay đổi, giữ nguyên: {final_audio}")
+        return final_audio
+
+    layout = None
+    if chapter_pause is not None:
+        with span("silence", files=len(audio_files)):
+            analyses = analyze_parts(audio_files, log_func=log_func)
+        with span("merge", files=len(audio_files)):
+            layout = merge_with_pacing(final_audio, audio_files, analyses, chapter_pause, infos, log_func)
+    if layout:
+        merged = True
+        write_silence_map(silence_file, build_silence_map(analyses, layout, chapter_pause))
+        log_func(f"🗺️ Đã lưu silence map: {silence_file}")
+    else:
+        with span("merge", files=len(audio_files)):
+            merged = merge_audio_files(final_audio, audio_files, infos=infos)
+    if merged:
         log_func(f"\n🎉 Hoàn thành!")
         log_func(f"🎵 File audio cuối cùng: {final_audio}")
 
         try:
-            timestamps = []
-            current_time_ms = 0
-            for audio_file in audio_files:
-                seg = AudioSegment.from_file(audio_file)
-                timestamps.append(current_time_ms)
-                current_time_ms += len(seg)
-
-            chapter_file = os.path.join(output_dir, f"{base_name}-chapters.txt")
-            with open(chapter_file, "w", encoding="utf-8") as f:
-                for i, t in enumerate(timestamps):
-                    minutes = int(t // 60000)
-                    seconds = int((t % 60000) / 1000)
-                    f.write(f"{minutes:02}:{seconds:02} {chapter_titles[i]}\n")
-            log_func(f"📖 Đã tạo chapter file: {chapter_file}")
+            if layout:
+                durations = [entry["duration_ms"] for entry in layout]
+            else:
+                durations = [
+                    info["duration_ms"] if info else len(audio_segment().from_file(audio_file))
+                    for info, audio_file in zip(infos, audio_files)
+                ]
+            write_chapter_files(output_dir, base_name, final_audio, chapter_titles, durations, log_func)
         except Exception as e:
             log_func(f"⚠️ Lỗi khi tạo chapter file: {e}")
+            durations = None
 
+        if subtitles and durations:
+            try:
+                words_files = [os.path.splitext(path)[0] + ".words.json" for path in audio_files]
+                shifts = [entry["shift_ms"] for entry in layout] if layout else None
+                write_subtitles_from_words(srt_file, words_files, durations, log_func, shifts)
+            except Exception as e:
+                log_func(f"⚠️ Lỗi khi tạo phụ đề: {e}")
+
+        if durations:
+            record_artifact(state_path, "audio", audio_key, outputs, chapters=[
+                {"title": title, "key": entry["key"], "duration_ms": duration}
+                for title, entry, duration in zip(chapter_titles, results, durations)
+            ])
         return final_audio
     else:
         return ""
+
+
+def convert_streaming(
+    chapter_parts: list,
+    output_dir: str,
+    base_name: str,
+    voice: str,
+    rate: str,
+    log_func,
+    concurrency: int,
+    requests_per_second: float,
+    max_chunk_chars: int,
+    max_retries: int,
+    subtitles: bool,
+    backend: TTSBackend,
+    cancel_event: threading.Event = None,
+    progress_func=None
+) -> str:
+    """Phần còn lại của convert_text_file_to_speech khi keep_parts=False."""
+    chapter_titles = [title for title, _ in chapter_parts]
+    final_audio = os.path.join(output_dir, f"{base_name}-final.mp3")
+    srt_file = os.path.splitext(final_audio)[0] + ".srt"
+    outputs = [final_audio] + ([srt_file] if subtitles else [])
+
+    keys = [make_cache_key(text, voice, rate, *backend.cache_tag()) for _, text in chapter_parts]
+    state_path = build_state_path(output_dir, base_name)
+    audio_key = artifact_key([], {
+        "chapters": [[title, key] for title, key in zip(chapter_titles, keys)],
+        "subtitles": subtitles,
+    })
+    if is_fresh(state_path, "audio", audio_key, outputs):
+        log_func(f"⏭️ Không có chương nào thay đổi, giữ nguyên: {final_audio}")
+        return final_audio
+
+    log_func(f"🌊 Ghi audio trực tiếp vào {os.path.basename(final_audio)} (không tạo file part)")
+    chars = sum(len(text) for _, text in chapter_parts)
+    with span("tts.stream", chars=chars, chapters=len(chapter_parts), backend=backend.name):
+        results = asyncio.run(stream_chapters_to_file(
+            chapter_parts, final_audio, voice, rate, concurrency, requests_per_second,
+            log_func, max_chunk_chars, max_retries, backend, cancel_event, progress_func
+        ))
+    if cancel_event and cancel_event.is_set():
+        log_func("⛔ Đã hủy, giữ nguyên file audio cũ (nếu có)")
+        return ""
+    if not results:
+        return ""
+    log_func(f"\n🎉 Hoàn thành!")
+    log_func(f"🎵 File audio cuối cùng: {final_audio}")
+
+    durations = [chapter["duration_ms"] for chapter in results]
+    try:
+        write_chapter_files(output_dir, base_name, final_audio, chapter_titles, durations, log_func)
+    except Exception as e:
+        log_func(f"⚠️ Lỗi khi tạo chapter file: {e}")
+    if subtitles:
+        try:
+            write_subtitles_from_words(srt_file, [chapter["words"] for chapter in results], durations, log_func)
+        except Exception as e:
+            log_func(f"⚠️ Lỗi khi tạo phụ đề: {e}")
+
+    record_artifact(state_path, "audio", audio_key, outputs, chapters=[
+        {"title": title, "key": key, "duration_ms": duration}
+        for title, key, duration in zip(chapter_titles, keys, durations)
+    ])
+    return final_audio
@@ -10,7 +10,8 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # GUI chỉ chạy convert: không đóng gói Whisper/torch/moviepy (nạp muộn ở subtitle/video)
+    excludes=['torch', 'whisper', 'moviepy', 'numpy'],
     noarchive=False,
     optimize=0,
 )
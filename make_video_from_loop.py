@@ -2,87 +2,96 @@ import os
 import subprocess
 import math
 import re
-from moviepy.editor import VideoFileClip, AudioFileClip
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import tempfile
+import time
+from media_probe import find_tool, get_duration, probe_media
+from run_report import span
 
 
-def make_video_loop_with_ffmpeg(video_path, audio_path, output_path, log_func=print, music_path=None, music_volume=30):
-    # Kiểm tra tồn tại file đầu vào
-    if not os.path.exists(video_path) or not os.path.exists(audio_path):
-        log_func("❌ Không tìm thấy file video hoặc audio.")
-        return
+LOOP_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "text-to-speech", "loops")
 
-    log_func("🔄 Đang tính toán...")
+# Các profile output: đánh đổi tốc độ encode / chất lượng / dung lượng
+# fps=None giữ nguyên fps của video nền; threads=0 để x264 tự chọn
+VIDEO_PROFILES = {
+    "default": {"width": 1280, "height": 720, "fps": None, "preset": "fast", "crf": 23,
+                "tune": None, "audio_bitrate": "128k", "threads": 0},
+    "fast": {"width": 1280, "height": 720, "fps": 24, "preset": "veryfast", "crf": 25,
+             "tune": None, "audio_bitrate": "128k", "threads": 0},
+    "draft": {"width": 854, "height": 480, "fps": 15, "preset": "ultrafast", "crf": 28,
+              "tune": None, "audio_bitrate": "96k", "threads": 0},
+    "slideshow": {"width": 1280, "height": 720, "fps": 5, "preset": "medium", "crf": 23,
+                  "tune": "stillimage", "audio_bitrate": "128k", "threads": 0},
+    "1080p": {"width": 1920, "height": 1080, "fps": None, "preset": "medium", "crf": 21,
+              "tune": None, "audio_bitrate": "192k", "threads": 0},
+}
 
-    try:
-        # Lấy duration của video chính và audio chính
-        video_clip = VideoFileClip(video_path)
-        audio_clip = AudioFileClip(audio_path)
-        video_duration = video_clip.duration
-        audio_duration = audio_clip.duration
-        video_clip.close()
-        audio_clip.close()
-
-        # Tính số lần loop video để đủ dài cho audio chính
-        video_loops = math.ceil(audio_duration / video_duration) - 1
 
-        # Nếu có audio nền, tính số lần loop cho nó
-        if music_path and os.path.exists(music_path):
-            music_clip = AudioFileClip(music_path)
-            music_duration = music_clip.duration
-            music_clip.close()
-            music_loops = math.ceil(audio_duration / music_duration) - 1
-        else:
-            music_loops = 0
+def get_profile(profile):
+    """Nhận tên profile hoặc dict; dict được bổ sung các giá trị thiếu từ 'default'."""
+    if isinstance(profile, dict):
+        return {**VIDEO_PROFILES["default"], **profile}
+    if profile not in VIDEO_PROFILES:
+        raise ValueError(f"Không có profile '{profile}'. Có: {', '.join(VIDEO_PROFILES)}")
+    return VIDEO_PROFILES[profile]
 
-        log_func(f"📺 Video: {video_duration:.2f}s (loop {video_loops + 1} lần)")
-        if music_path:
-            log_func(f"🎧 Music nền: {music_duration:.2f}s (loop {music_loops + 1} lần), volume: {music_volume}%")
-        log_func(f"🎵 Audio chính: {audio_duration:.2f}s")
 
-        ffmpeg_path = os.path.abspath("ffmpeg.exe")
+def needs_scaling(profile, source_video):
+    source_video = source_video or {}
+    return (source_video.get("width"), source_video.get("height")) != (profile["width"], profile["height"])
 
-        # Xây dựng command FFmpeg với stream_loop cho video và optional music
-        cmd = [
-            ffmpeg_path,
-            "-stream_loop", str(video_loops), "-i", video_path,
-            "-i", audio_path
-        ]
-        if music_path:
-            cmd.extend(["-stream_loop", str(music_loops), "-i", music_path])
 
-        # Filter video: scale + pad
-        filter_video = (
-            "scale=1280:720:force_original_aspect_ratio=decrease,"  
-            "pad=1280:720:(ow-iw)/2:(oh-ih)/2[outv]"
+def needs_fps_change(profile, source_video):
+    return bool(profile.get("fps")) and (source_video or {}).get("fps") != profile["fps"]
+
+
+def build_video_filter(profile, source_video=None):
+    """
+    Filter scale + pad (và đổi fps) theo profile, bỏ qua bước nào video nền đã đúng sẵn.
+    `source_video` là phần "video" của media_probe.probe_media().
+    """
+    width, height = profile["width"], profile["height"]
+    parts = []
+    if needs_scaling(profile, source_video):
+        parts.append(
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"
         )
+    if needs_fps_change(profile, source_video):
+        parts.append(f"fps={profile['fps']}")
+    return ",".join(parts) or "null"
 
-        # Filter audio: mix music và audio chính giữ nguyên volume chính
-        if music_path:
-            music_vol = music_volume / 100
-            filter_audio = (
-                f"[2:a]volume={music_vol}[bg];"
-                "[1:a][bg]"
-                "amix=inputs=2:duration=longest:dropout_transition=2:normalize=0[outa]"
-            )
-        else:
-            filter_audio = "[1:a]anull[outa]"
-
-        filter_complex = f"{filter_video};{filter_audio}"
-
-        cmd.extend([
-            "-filter_complex", filter_complex,
-            "-map", "[outv]",
-            "-map", "[outa]",
-            "-c:v", "libx264",
-            "-preset", "fast",
-            "-c:a", "aac",
-            "-to", str(audio_duration),  # Cắt đúng bằng độ dài audio chính
-            "-y",
-            output_path
-        ])
 
-        log_func("🎬 Bắt đầu render video...")
+def video_encoder_args(profile):
+    args = [
+        "-c:v", "libx264",
+        "-preset", profile["preset"],
+        "-crf", str(profile["crf"]),
+        "-pix_fmt", "yuv420p",
+    ]
+    if profile.get("tune"):
+        args.extend(["-tune", profile["tune"]])
+    if profile.get("threads"):
+        args.extend(["-threads", str(profile["threads"])])
+    if profile.get("gop"):
+        args.extend(["-g", str(profile["gop"])])
+    return args
+
+
+def audio_encoder_args(profile):
+    return ["-c:a", "aac", "-b:a", profile["audio_bitrate"]]
 
+
+def run_ffmpeg(cmd, duration, log_func=print, label="Render", on_time=None):
+    """
+    Chạy ffmpeg, đọc stderr để log tiến độ theo `time=`; trả về True nếu thành công.
+    Nếu có `on_time`, giá trị time (giây) được chuyển cho callback thay vì log trực tiếp.
+    """
+    with span(f"ffmpeg.{label}", audio_seconds=duration or 0, frames=0) as stats:
         process = subprocess.Popen(
             cmd,
             stderr=subprocess.PIPE,
@@ -92,16 +101,516 @@ def make_video_loop_with_ffmpeg(video_path, audio_path, output_path, log_func=pr
         # Đọc stderr để hiển thị tiến độ
         for line in process.stderr:
             line = line.strip()
+            frame = re.search(r"frame=\s*(\d+)", line)
+            if frame:
+                stats["frames"] = int(frame.group(1))
             if "time=" in line:
                 m = re.search(r"time=(\d{2}):(\d{2}):(\d{2}\.\d{2})", line)
-                if m:
+                if m and (duration or on_time):
                     h, mi, s = m.groups()
                     current_time = int(h)*3600 + int(mi)*60 + float(s)
-                    percent = (current_time / audio_duration) * 100
-                    log_func(f"⏳ Render: {percent:.2f}%")
+                    if on_time:
+                        on_time(current_time)
+                        continue
+                    percent = (current_time / duration) * 100
+                    log_func(f"⏳ {label}: {percent:.2f}%")
 
         process.wait()
-        if process.returncode == 0:
+        stats["ok"] = process.returncode == 0
+    return process.returncode == 0
+
+
+def build_audio_filter(music_path, music_volume, audio_input=1, music_input=2):
+    # Filter audio: mix music và audio chính giữ nguyên volume chính
+    if music_path:
+        music_vol = music_volume / 100
+        gain = f"volume={music_vol}" if music_volume != 100 else "anull"
+        return (
+            f"[{music_input}:a]{gain}[bg];"
+            f"[{audio_input}:a][bg]"
+            "amix=inputs=2:duration=longest:dropout_transition=2:normalize=0[outa]"
+        )
+    return f"[{audio_input}:a]anull[outa]"
+
+
+def prepare_loop_segment(video_path, profile="default", log_func=print, cache_dir=LOOP_CACHE_DIR):
+    """
+    Encode một lần đoạn video nền đã scale + pad sang đúng độ phân giải, lưu vào cache.
+
+    Key cache gồm đường dẫn, mtime, size của video gốc và các thông số encode của
+    profile, nên đổi video nền hoặc profile sẽ tạo bản mới. Nếu video nền đã là
+    H.264 yuv420p đúng kích thước và fps thì dùng luôn file gốc, không encode.
+    Trả về đường dẫn file, hoặc None nếu lỗi.
+    """
+    profile = get_profile(profile)
+    source_video = probe_media(video_path)["video"] or {}
+    if (not needs_scaling(profile, source_video) and not needs_fps_change(profile, source_video)
+            and source_video.get("codec") == "h264" and source_video.get("pix_fmt") in ("yuv420p", None)):
+        log_func("⚡ Video nền đã đúng định dạng, dùng trực tiếp không encode lại")
+        return video_path
+
+    st = os.stat(video_path)
+    settings = "|".join(str(profile[k]) for k in sorted(profile))
+    key_source = f"{os.path.abspath(video_path)}|{st.st_mtime_ns}|{st.st_size}|{settings}"
+    key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()[:24]
+    os.makedirs(cache_dir, exist_ok=True)
+    segment_path = os.path.join(cache_dir, f"loop-{key}.mp4")
+    if os.path.exists(segment_path):
+        log_func("♻️ Dùng lại đoạn loop đã encode sẵn")
+        return segment_path
+
+    log_func("🧩 Đang encode đoạn loop (chỉ làm một lần cho mỗi video nền)...")
+    tmp_path = segment_path + ".tmp.mp4"
+    cmd = [
+        find_tool("ffmpeg"),
+        "-i", video_path,
+        "-vf", build_video_filter(profile, source_video),
+        "-an",
+        *video_encoder_args(profile),
+        # GOP đóng, bắt đầu bằng keyframe để nối lặp lại bằng -c copy không bị lỗi hình
+        "-flags", "+cgop",
+        "-force_key_frames", "expr:eq(n,0)",
+        "-y",
+        tmp_path
+    ]
+    if not run_ffmpeg(cmd, get_duration(video_path), log_func, "Encode loop"):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, segment_path)
+    return segment_path
+
+
+def write_concat_list(list_path, files):
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for path in files:
+            escaped = os.path.abspath(path).replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+
+def escape_filter_path(path):
+    """Escape đường dẫn cho filter ffmpeg (vd. subtitles=), kể cả ổ đĩa Windows C:\\..."""
+    return os.path.abspath(path).replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+
+
+def render_video_chunks(
+    video_path,
+    video_duration,
+    total_duration,
+    output_path,
+    video_filter,
+    workers=4,
+    log_func=print,
+    profile="default"
+):
+    """
+    Chia timeline thành `workers` khoảng thời gian và encode song song bằng nhiều process ffmpeg.
+
+    Mỗi worker seek vào đúng vị trí trong video nền đang loop (-ss theo phần dư của
+    độ dài loop) và dịch PTS về thời gian toàn cục trước khi qua `video_filter`, để
+    phụ đề/overlay theo thời gian khớp với video cuối. Trả về danh sách file đoạn theo
+    thứ tự, hoặc None nếu có worker lỗi.
+    """
+    ffmpeg_path = find_tool("ffmpeg")
+    step = total_duration / workers
+    bounds = [(i * step, total_duration if i == workers - 1 else (i + 1) * step) for i in range(workers)]
+    chunk_paths = [f"{output_path}.chunk-{i:03d}.mp4" for i in range(1, workers + 1)]
+
+    done_times = [0.0] * workers
+    lock = threading.Lock()
+    last_percent = [-1.0]
+
+    def report(index, current_time):
+        # Gộp time= của mọi worker thành một phần trăm chung
+        with lock:
+            done_times[index] = current_time
+            percent = sum(done_times) / total_duration * 100
+            if percent - last_percent[0] >= 0.5:
+                last_percent[0] = percent
+                log_func(f"⏳ Render: {percent:.2f}% ({workers} luồng)")
+
+    def render(index):
+        start, end = bounds[index]
+        cmd = [
+            ffmpeg_path,
+            "-stream_loop", "-1",
+            "-ss", f"{start % video_duration:.3f}",
+            "-i", video_path,
+            "-t", f"{end - start:.3f}",
+            "-vf", f"setpts=PTS-STARTPTS+{start:.3f}/TB,{video_filter},setpts=PTS-STARTPTS",
+            "-an",
+            *video_encoder_args(get_profile(profile)),
+            "-y",
+            chunk_paths[index]
+        ]
+        return run_ffmpeg(cmd, end - start, log_func, on_time=lambda t: report(index, t))
+
+    log_func(f"🧵 Render song song {workers} đoạn, mỗi đoạn ~{step:.0f}s")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(render, range(workers)))
+    if not all(results):
+        for path in chunk_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        return None
+    return chunk_paths
+
+
+def prepare_music_bed(
+    music_path,
+    music_volume=30,
+    target_lufs=-16.0,
+    crossfade=2.0,
+    log_func=print,
+    cache_dir=LOOP_CACHE_DIR
+):
+    """
+    Chuẩn bị một lần "music bed" từ file nhạc nền và lưu vào cache theo
+    (file nhạc, volume, LUFS, crossfade):
+      - phần cuối bài được crossfade vào phần đầu để loop không bị hụt/giật
+      - chuẩn hóa loudness 2 pass (loudnorm) về target_lufs để mọi sách có mức nhạc như nhau
+      - áp volume rồi encode AAC, lúc render chỉ cần mix (volume đã nằm sẵn trong file)
+    Trả về đường dẫn file .m4a, hoặc None nếu lỗi.
+    """
+    st = os.stat(music_path)
+    key_source = (f"{os.path.abspath(music_path)}|{st.st_mtime_ns}|{st.st_size}|"
+                  f"{music_volume}|{target_lufs}|{crossfade}")
+    key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()[:24]
+    os.makedirs(cache_dir, exist_ok=True)
+    bed_path = os.path.join(cache_dir, f"music-{key}.m4a")
+    if os.path.exists(bed_path):
+        log_func("♻️ Dùng lại music nền đã chuẩn hóa")
+        return bed_path
+
+    ffmpeg_path = find_tool("ffmpeg")
+    duration = get_duration(music_path)
+    fade = min(crossfade, duration / 4)
+    body_end = duration - fade
+    # Phần đuôi (fade out) được mix đè lên phần đầu (fade in): nối bản này liên tiếp sẽ liền mạch
+    loop_filter = (
+        f"[0:a]asplit=2[head][tail];"
+        f"[head]atrim=0:{body_end:.3f},asetpts=PTS-STARTPTS,afade=t=in:d={fade:.3f}[body];"
+        f"[tail]atrim={body_end:.3f},asetpts=PTS-STARTPTS,afade=t=out:d={fade:.3f}[end];"
+        f"[body][end]amix=inputs=2:duration=first:normalize=0"
+    )
+    loudnorm = f"loudnorm=I={target_lufs}:TP=-2:LRA=11"
+
+    log_func(f"🎚️ Đang chuẩn hóa music nền về {target_lufs} LUFS (chỉ làm một lần)...")
+    try:
+        stderr = subprocess.run(
+            [ffmpeg_path, "-hide_banner", "-i", music_path,
+             "-filter_complex", f"{loop_filter},{loudnorm}:print_format=json",
+             "-f", "null", "-"],
+            capture_output=True
+        ).stderr.decode("utf-8", errors="replace")
+        measured = json.loads(stderr[stderr.rindex("{"):stderr.rindex("}") + 1])
+    except (OSError, ValueError) as e:
+        log_func(f"⚠️ Không đo được loudness của music nền: {e}")
+        return None
+
+    second_pass = (
+        f"{loudnorm}:measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+        f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+        f":offset={measured['target_offset']}:linear=true"
+    )
+    tmp_path = bed_path + ".tmp.m4a"
+    cmd = [
+        ffmpeg_path,
+        "-i", music_path,
+        "-filter_complex", f"{loop_filter},{second_pass},volume={music_volume / 100}",
+        "-ar", "48000",
+        "-c:a", "aac", "-b:a", "128k",
+        "-y",
+        tmp_path
+    ]
+    if not run_ffmpeg(cmd, body_end, log_func, "Music nền"):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, bed_path)
+    return bed_path
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+# Kết quả phát hiện video tĩnh: (đường dẫn, mtime, size) -> bool
+_low_motion_cache = {}
+
+
+def is_low_motion(video_path, noise_db=-50, log_func=print):
+    """
+    Dùng freezedetect của ffmpeg để xem video nền có gần như đứng yên suốt clip không
+    (vd. ảnh bìa xuất ra thành mp4). Kết quả được cache theo mtime/size.
+    """
+    st = os.stat(video_path)
+    key = (os.path.abspath(video_path), st.st_mtime_ns, st.st_size)
+    if key in _low_motion_cache:
+        return _low_motion_cache[key]
+
+    duration = get_duration(video_path)
+    min_freeze = max(duration * 0.9, 0.1)
+    cmd = [
+        find_tool("ffmpeg"), "-hide_banner",
+        "-i", video_path,
+        "-map", "0:v:0",
+        "-vf", f"freezedetect=n={noise_db}dB:d={min_freeze:.2f}",
+        "-f", "null", "-"
+    ]
+    try:
+        stderr = subprocess.run(cmd, capture_output=True).stderr.decode("utf-8", errors="replace")
+    except OSError as e:
+        log_func(f"⚠️ Không kiểm tra được chuyển động của video nền: {e}")
+        return False
+    frozen = "freeze_start" in stderr
+    m = re.search(r"freeze_duration: ([\d.]+)", stderr)
+    if m:
+        frozen = float(m.group(1)) >= min_freeze
+    _low_motion_cache[key] = frozen
+    return frozen
+
+
+def extract_still_frame(video_path, log_func=print, cache_dir=LOOP_CACHE_DIR):
+    """Lấy frame đầu của video nền làm ảnh tĩnh (cache theo nguồn)."""
+    st = os.stat(video_path)
+    key_source = f"{os.path.abspath(video_path)}|{st.st_mtime_ns}|{st.st_size}"
+    key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()[:24]
+    os.makedirs(cache_dir, exist_ok=True)
+    frame_path = os.path.join(cache_dir, f"still-{key}.png")
+    if not os.path.exists(frame_path):
+        tmp_path = frame_path + ".tmp.png"
+        cmd = [find_tool("ffmpeg"), "-i", video_path, "-frames:v", "1", "-y", tmp_path]
+        if not run_ffmpeg(cmd, None, log_func):
+            return None
+        os.replace(tmp_path, frame_path)
+    return frame_path
+
+
+def find_still_source(video_path, detect_low_motion=True, log_func=print):
+    """
+    Trả về (True, ảnh) nếu nền là ảnh tĩnh hoặc video gần như đứng yên,
+    (True, None) nếu không có nền (chỉ có audio, dùng nền đen), (False, None) nếu là video thường.
+    """
+    if not video_path:
+        return True, None
+    if video_path.lower().endswith(IMAGE_EXTENSIONS):
+        return True, video_path
+    if detect_low_motion and is_low_motion(video_path, log_func=log_func):
+        frame = extract_still_frame(video_path, log_func)
+        if frame:
+            return True, frame
+    return False, None
+
+
+def render_still_video(
+    image_path,
+    audio_path,
+    output_path,
+    audio_duration,
+    audio_inputs,
+    audio_filter,
+    profile,
+    subtitle_path=None,
+    log_func=print
+):
+    """
+    Render video từ một ảnh tĩnh (hoặc nền đen nếu image_path=None) ở fps rất thấp
+    với -tune stillimage: gần như toàn bộ thời gian chỉ còn encode audio.
+    """
+    # Có phụ đề thì cần fps cao hơn một chút để phụ đề đổi đúng lúc
+    fps = 5 if subtitle_path else 1
+    still_profile = {**profile, "fps": fps, "tune": "stillimage", "gop": fps * 10}
+    width, height = profile["width"], profile["height"]
+
+    if image_path:
+        source_video = {**(probe_media(image_path)["video"] or {}), "fps": fps}
+        video_input = ["-loop", "1", "-framerate", str(fps), "-i", image_path]
+        video_filter = build_video_filter(still_profile, source_video)
+    else:
+        video_input = ["-f", "lavfi", "-i", f"color=c=black:s={width}x{height}:r={fps}"]
+        video_filter = "null"
+    if subtitle_path:
+        video_filter += f",subtitles='{escape_filter_path(subtitle_path)}'"
+
+    cmd = [
+        find_tool("ffmpeg"),
+        *video_input,
+        "-i", audio_path,
+        *audio_inputs,
+        "-filter_complex", f"[0:v]{video_filter}[outv];{audio_filter}",
+        "-map", "[outv]",
+        "-map", "[outa]",
+        *video_encoder_args(still_profile),
+        *audio_encoder_args(profile),
+        "-t", str(audio_duration),
+        "-y",
+        output_path
+    ]
+    log_func(f"🖼️ Nền tĩnh: render {fps} fps với -tune stillimage")
+    return run_ffmpeg(cmd, audio_duration, log_func)
+
+
+def make_video_loop_with_ffmpeg(
+    video_path,
+    audio_path,
+    output_path,
+    log_func=print,
+    music_path=None,
+    music_volume=30,
+    stream_copy=True,
+    subtitle_path=None,
+    workers=1,
+    profile="default",
+    detect_still=True,
+    music_lufs=-16.0
+):
+    """
+    Ghép video nền lặp lại với audio (và music nền tùy chọn) thành video dài bằng audio.
+
+    Mặc định (stream_copy=True) video nền được encode một lần thành đoạn loop
+    trong cache rồi nối bằng concat demuxer với -c:v copy, nên mỗi lần render chỉ
+    encode audio. stream_copy=False dùng cách cũ: scale/pad + libx264 toàn bộ video.
+
+    Khi cần encode lại toàn bộ (burn phụ đề `subtitle_path`, hoặc stream_copy=False),
+    workers > 1 chia timeline cho nhiều process ffmpeg chạy song song rồi nối lại không mất chất lượng.
+
+    `profile` là tên trong VIDEO_PROFILES (hoặc dict) quy định độ phân giải, fps, CRF/preset, bitrate audio.
+
+    Nền là ảnh (png/jpg...), video gần như đứng yên (detect_still), hoặc không có
+    video_path (chỉ audio, nền đen) sẽ được render ở 1 fps với -tune stillimage.
+
+    Music nền được chuẩn hóa về `music_lufs` và crossfade ở điểm loop một lần rồi cache
+    (prepare_music_bed); music_lufs=None để mix trực tiếp file gốc như trước.
+    """
+    # Kiểm tra tồn tại file đầu vào
+    if (video_path and not os.path.exists(video_path)) or not os.path.exists(audio_path):
+        log_func("❌ Không tìm thấy file video hoặc audio.")
+        return
+
+    log_func("🔄 Đang tính toán...")
+
+    try:
+        # Lấy duration của audio chính (đọc header, không giải mã)
+        audio_duration = get_duration(audio_path)
+
+        # Nếu có audio nền, tính số lần loop cho nó
+        if music_path and not os.path.exists(music_path):
+            log_func(f"⚠️ Không tìm thấy music nền: {music_path}, bỏ qua")
+            music_path = None
+        if music_path and music_lufs is not None:
+            bed_path = prepare_music_bed(music_path, music_volume, music_lufs, log_func=log_func)
+            if bed_path:
+                # Volume đã được áp sẵn trong music bed
+                music_path, music_volume = bed_path, 100
+        if music_path:
+            music_duration = get_duration(music_path)
+            music_loops = math.ceil(audio_duration / music_duration) - 1
+        else:
+            music_loops = 0
+
+        if music_path:
+            log_func(f"🎧 Music nền: {music_duration:.2f}s (loop {music_loops + 1} lần), volume: {music_volume}%")
+        log_func(f"🎵 Audio chính: {audio_duration:.2f}s")
+
+        ffmpeg_path = find_tool("ffmpeg")
+
+        profile = get_profile(profile)
+        log_func(f"🎛️ Profile: {profile['width']}x{profile['height']}, preset {profile['preset']}, crf {profile['crf']}")
+
+        is_still, still_image = find_still_source(video_path, detect_still, log_func)
+        if is_still:
+            audio_inputs = ["-stream_loop", str(music_loops), "-i", music_path] if music_path else []
+            ok = render_still_video(
+                still_image, audio_path, output_path, audio_duration, audio_inputs,
+                build_audio_filter(music_path, music_volume), profile, subtitle_path, log_func
+            )
+            if ok:
+                log_func(f"\n✅ Video đã tạo tại: {output_path}")
+            else:
+                log_func("❌ FFmpeg thất bại.")
+            return
+
+        # Lấy duration của video nền và tính số lần loop để đủ dài cho audio chính
+        video_duration = get_duration(video_path)
+        video_loops = math.ceil(audio_duration / video_duration) - 1
+        log_func(f"📺 Video: {video_duration:.2f}s (loop {video_loops + 1} lần)")
+
+        # Filter video: scale + pad (+ burn phụ đề nếu có)
+        video_filter = build_video_filter(profile, probe_media(video_path)["video"])
+        if subtitle_path:
+            video_filter += f",subtitles='{escape_filter_path(subtitle_path)}'"
+            # Phụ đề thay đổi theo thời gian nên không thể dùng đoạn loop copy
+            stream_copy = False
+
+        video_files = None
+        chunk_files = []
+        if stream_copy:
+            segment_path = prepare_loop_segment(video_path, profile, log_func)
+            if segment_path:
+                video_files = [segment_path] * math.ceil(audio_duration / get_duration(segment_path))
+            else:
+                log_func("⚠️ Không encode được đoạn loop, chuyển sang render toàn bộ")
+        if video_files is None and workers > 1:
+            chunk_files = render_video_chunks(
+                video_path, video_duration, audio_duration, output_path, video_filter, workers, log_func, profile
+            ) or []
+            if chunk_files:
+                video_files = chunk_files
+            else:
+                log_func("⚠️ Render song song lỗi, chuyển sang một process")
+
+        if video_files:
+            # Nối các đoạn video đã encode sẵn, chỉ copy stream video
+            list_path = output_path + ".concat.txt"
+            write_concat_list(list_path, video_files)
+            cmd = [
+                ffmpeg_path,
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-i", audio_path
+            ]
+            if music_path:
+                cmd.extend(["-stream_loop", str(music_loops), "-i", music_path])
+            cmd.extend([
+                "-filter_complex", build_audio_filter(music_path, music_volume),
+                "-map", "0:v",
+                "-map", "[outa]",
+                "-c:v", "copy",
+                *audio_encoder_args(profile),
+                "-t", str(audio_duration),
+                "-y",
+                output_path
+            ])
+        else:
+            list_path = None
+            # Xây dựng command FFmpeg với stream_loop cho video và optional music
+            cmd = [
+                ffmpeg_path,
+                "-stream_loop", str(video_loops), "-i", video_path,
+                "-i", audio_path
+            ]
+            if music_path:
+                cmd.extend(["-stream_loop", str(music_loops), "-i", music_path])
+
+            filter_complex = f"[0:v]{video_filter}[outv];{build_audio_filter(music_path, music_volume)}"
+
+            cmd.extend([
+                "-filter_complex", filter_complex,
+                "-map", "[outv]",
+                "-map", "[outa]",
+                *video_encoder_args(profile),
+                *audio_encoder_args(profile),
+                "-to", str(audio_duration),  # Cắt đúng bằng độ dài audio chính
+                "-y",
+                output_path
+            ])
+
+        log_func("🎬 Bắt đầu render video...")
+
+        ok = run_ffmpeg(cmd, audio_duration, log_func)
+        for path in [list_path] + chunk_files:
+            if path and os.path.exists(path):
+                os.remove(path)
+        if ok:
             log_func(f"\n✅ Video đã tạo tại: {output_path}")
         else:
             log_func("❌ FFmpeg thất bại.")
@@ -110,7 +619,56 @@ def make_video_loop_with_ffmpeg(video_path, audio_path, output_path, log_func=pr
         log_func(f"❌ Lỗi render video: {e}")
 
 
+def benchmark_profiles(reference_clip, duration=30, profiles=None, log_func=print):
+    """
+    Đo tốc độ encode (fps, số lần realtime) và dung lượng output của từng profile
+    trên một clip tham chiếu (được loop cho đủ `duration` giây, không có audio).
+    """
+    ffmpeg_path = find_tool("ffmpeg")
+    source_video = probe_media(reference_clip)["video"] or {}
+    results = []
+    log_func(f"📏 Benchmark {os.path.basename(reference_clip)}, {duration}s mỗi profile")
+    log_func(f"{'profile':<10} {'encode fps':>10} {'realtime':>9} {'size MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in profiles or VIDEO_PROFILES:
+            profile = get_profile(name)
+            output = os.path.join(tmp_dir, f"{name}.mp4")
+            cmd = [
+                ffmpeg_path,
+                "-stream_loop", "-1", "-i", reference_clip,
+                "-t", str(duration),
+                "-vf", build_video_filter(profile, source_video),
+                "-an",
+                *video_encoder_args(profile),
+                "-y",
+                output
+            ]
+            started = time.perf_counter()
+            ok = run_ffmpeg(cmd, duration, lambda msg: None)
+            elapsed = time.perf_counter() - started
+            if not ok:
+                log_func(f"{name:<10} ❌ lỗi encode")
+                continue
+            fps = profile["fps"] or source_video.get("fps") or 25
+            result = {
+                "profile": name,
+                "encode_fps": duration * fps / elapsed,
+                "realtime": duration / elapsed,
+                "size_mb": os.path.getsize(output) / 1024 / 1024,
+            }
+            results.append(result)
+            log_func(
+                f"{name:<10} {result['encode_fps']:>10.1f} {result['realtime']:>8.1f}x {result['size_mb']:>8.2f}"
+            )
+    return results
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--benchmark":
+        # python make_video_from_loop.py --benchmark clip.mp4 [giây]
+        benchmark_profiles(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 30)
+        sys.exit(0)
+
     # Ví dụ gọi hàm
     make_video_loop_with_ffmpeg(
         video_path="video.mp4",
@@ -0,0 +1,139 @@
+"""
+Đọc thông tin media (độ dài, kích thước, codec) mà không cần import moviepy.
+
+Thứ tự ưu tiên:
+    1. MP3: đọc header frame (mp3_frames), không chạy process nào
+    2. ffprobe -of json
+    3. ffmpeg -i (parse stderr) khi không có ffprobe, vd. bản build chỉ kèm ffmpeg.exe
+
+Kết quả được cache trong process theo (đường dẫn, mtime, size).
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+
+from mp3_frames import read_mp3_info
+
+_probe_cache = {}
+_probe_cache_lock = threading.Lock()
+
+
+def find_tool(name: str) -> str:
+    """Tìm ffmpeg/ffprobe: bản đóng gói PyInstaller, file .exe cạnh app, rồi đến PATH."""
+    exe_name = f"{name}.exe"
+    if getattr(sys, "frozen", False):
+        bundled = os.path.join(sys._MEIPASS, exe_name)
+        if os.path.exists(bundled):
+            return bundled
+    local = os.path.abspath(exe_name)
+    if os.path.exists(local):
+        return local
+    return shutil.which(name) or name
+
+
+def probe_media(path: str) -> dict:
+    """
+    Trả về dict {"duration", "video": {...} | None, "audio": {...} | None}.
+    Ném RuntimeError nếu không đọc được file.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    with _probe_cache_lock:
+        if key in _probe_cache:
+            return _probe_cache[key]
+
+    info = None
+    if path.lower().endswith(".mp3"):
+        mp3 = read_mp3_info(path)
+        if mp3:
+            info = {
+                "duration": mp3["duration_ms"] / 1000,
+                "video": None,
+                "audio": {"codec": "mp3", "sample_rate": mp3["sample_rate"], "channels": mp3["channels"]},
+            }
+    if info is None:
+        info = probe_with_ffprobe(path) or probe_with_ffmpeg(path)
+
+    with _probe_cache_lock:
+        _probe_cache[key] = info
+    return info
+
+
+def get_duration(path: str) -> float:
+    return probe_media(path)["duration"]
+
+
+def probe_with_ffprobe(path: str):
+    ffprobe = find_tool("ffprobe")
+    try:
+        output = subprocess.run(
+            [ffprobe, "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+            capture_output=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    data = json.loads(output.decode("utf-8", errors="replace"))
+
+    info = {"duration": float(data.get("format", {}).get("duration") or 0), "video": None, "audio": None}
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and info["video"] is None:
+            num, _, den = (stream.get("avg_frame_rate") or "0/1").partition("/")
+            info["video"] = {
+                "codec": stream.get("codec_name"),
+                "width": stream.get("width"),
+                "height": stream.get("height"),
+                "fps": float(num) / float(den) if den and float(den) else 0.0,
+                "pix_fmt": stream.get("pix_fmt"),
+                # Ảnh tĩnh (png/jpg) được ffprobe báo là video 1 frame
+                "frames": int(stream["nb_frames"]) if str(stream.get("nb_frames", "")).isdigit() else None,
+            }
+        elif stream.get("codec_type") == "audio" and info["audio"] is None:
+            info["audio"] = {
+                "codec": stream.get("codec_name"),
+                "sample_rate": int(stream.get("sample_rate") or 0),
+                "channels": stream.get("channels"),
+            }
+        if not info["duration"] and stream.get("duration"):
+            info["duration"] = float(stream["duration"])
+    return info
+
+
+def probe_with_ffmpeg(path: str) -> dict:
+    ffmpeg = find_tool("ffmpeg")
+    try:
+        stderr = subprocess.run([ffmpeg, "-hide_banner", "-i", path], capture_output=True).stderr
+    except OSError as e:
+        raise RuntimeError(f"Không chạy được ffmpeg để đọc {path}: {e}")
+    text = stderr.decode("utf-8", errors="replace")
+
+    # Ảnh tĩnh báo "Duration: N/A", vẫn đọc tiếp thông tin stream
+    m = re.search(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)", text)
+    if not m and "Duration: N/A" not in text:
+        raise RuntimeError(f"Không đọc được thông tin media: {path}")
+    duration = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3)) if m else 0.0
+    info = {"duration": duration, "video": None, "audio": None}
+
+    m = re.search(r"Stream #\S+.*?Video: (\w+).*?, (\d{2,5})x(\d{2,5})", text)
+    if m:
+        fps = re.search(r"([\d.]+) fps", text)
+        info["video"] = {
+            "codec": m.group(1),
+            "width": int(m.group(2)),
+            "height": int(m.group(3)),
+            "fps": float(fps.group(1)) if fps else 0.0,
+            "pix_fmt": None,
+            "frames": None,
+        }
+    m = re.search(r"Stream #\S+.*?Audio: (\w+).*?(\d+) Hz", text)
+    if m:
+        info["audio"] = {"codec": m.group(1), "sample_rate": int(m.group(2)), "channels": None}
+    return info
+
+
+def clear_probe_cache():
+    with _probe_cache_lock:
+        _probe_cache.clear()
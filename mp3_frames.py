@@ -0,0 +1,216 @@
+import mmap
+import os
+
+# Bảng bitrate (kbps) theo (MPEG version, layer); version 2.5 dùng chung bảng với 2
+BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+VERSIONS = {0b00: 2.5, 0b10: 2, 0b11: 1}
+LAYERS = {0b01: 3, 0b10: 2, 0b11: 1}
+
+
+def parse_frame_header(header: bytes):
+    """
+    Đọc 4 byte header của một frame MP3.
+    Trả về dict (version, layer, bitrate, sample_rate, channels, samples, length) hoặc None nếu không hợp lệ.
+    """
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = VERSIONS.get((header[1] >> 3) & 0x03)
+    layer = LAYERS.get((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    channels = 1 if (header[3] >> 6) == 0b11 else 2
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 576 if (layer == 3 and version != 1) else 1152
+        length = samples // 8 * bitrate // sample_rate + padding
+
+    return {
+        "version": version,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "samples": samples,
+        "length": length,
+    }
+
+
+def id3v2_size(data) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def read_mp3_info(path: str) -> dict:
+    """
+    Duyệt header các frame MP3 (không giải mã) để lấy định dạng và độ dài.
+
+    Trả về dict gồm version/layer/bitrate/sample_rate/channels, `duration_ms`, `frames`
+    và vùng byte [audio_start, audio_end) chứa frame audio (bỏ tag ID3 và
+    frame Xing/Info). Trả về None nếu file không phải MP3 đọc được.
+    """
+    size = os.path.getsize(path)
+    if size < 4:
+        return None
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return scan_mp3(data, size)
+
+
+def scan_mp3(data, size: int = None) -> dict:
+    """Như read_mp3_info nhưng trên buffer đã có trong bộ nhớ (bytes, mmap), vd. audio đang stream."""
+    if size is None:
+        size = len(data)
+    if size < 4:
+        return None
+
+    pos = id3v2_size(data)
+    # Tìm frame đầu tiên: cần hai frame liên tiếp hợp lệ để chắc chắn đã đồng bộ
+    first = None
+    limit = min(size - 4, pos + 64 * 1024)
+    while pos < limit:
+        pos = data.find(b"\xff", pos, limit)
+        if pos < 0:
+            return None
+        first = parse_frame_header(data[pos:pos + 4])
+        if first:
+            following = pos + first["length"]
+            if following >= size or parse_frame_header(data[following:following + 4]):
+                break
+        first = None
+        pos += 1
+    if not first:
+        return None
+
+    # Frame Xing/Info chỉ chứa metadata, không được lặp lại khi nối file
+    frame = data[pos:pos + first["length"]]
+    audio_start = pos
+    if b"Xing" in frame[:48] or b"Info" in frame[:48]:
+        audio_start = pos + first["length"]
+
+    frames = 0
+    samples = 0
+    bitrate = first["bitrate"]
+    pos = audio_start
+    while pos + 4 <= size:
+        header = parse_frame_header(data[pos:pos + 4])
+        if not header or pos + header["length"] > size:
+            break
+        if not frames:
+            bitrate = header["bitrate"]  # frame audio đầu tiên (frame Xing có thể khác bitrate)
+        frames += 1
+        samples += header["samples"]
+        pos += header["length"]
+
+    return {
+        "version": first["version"],
+        "layer": first["layer"],
+        "bitrate": bitrate,
+        "sample_rate": first["sample_rate"],
+        "channels": first["channels"],
+        "frames": frames,
+        "duration_ms": samples * 1000 / first["sample_rate"],
+        "audio_start": audio_start,
+        "audio_end": pos,
+    }
+
+
+def codec_params(info: dict) -> tuple:
+    """
+    Thông số phải trùng nhau để nối frame. Gồm cả bitrate: file gộp không có
+    frame Xing/TOC nên player ước lượng độ dài và vị trí seek theo bitrate,
+    trộn bitrate sẽ làm lệch mốc chương.
+    """
+    return info["version"], info["layer"], info["bitrate"], info["sample_rate"], info["channels"]
+
+
+def frame_offsets(path: str, info: dict = None) -> list:
+    """
+    Vị trí byte đầu của từng frame audio trong file (từ read_mp3_info), thêm
+    `audio_end` ở cuối: frame [a, b) nằm trong byte [offsets[a], offsets[b]).
+    Mọi frame cùng số sample nên frame thứ k bắt đầu ở k * samples / sample_rate giây.
+    """
+    info = info or read_mp3_info(path)
+    offsets = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        pos = info["audio_start"]
+        while pos < info["audio_end"]:
+            header = parse_frame_header(data[pos:pos + 4])
+            if not header:
+                break
+            offsets.append(pos)
+            pos += header["length"]
+    offsets.append(pos)
+    return offsets
+
+
+def frame_seconds(info: dict) -> float:
+    """Độ dài một frame (giây)."""
+    return info["duration_ms"] / 1000 / max(info["frames"], 1)
+
+
+def concat_mp3_segments(segments: list, output_file: str):
+    """
+    Ghi nối tiếp các đoạn frame MP3 ra `output_file`. Mỗi đoạn là bytes (vd.
+    frame im lặng) hoặc (đường dẫn, byte đầu, byte cuối) đọc theo khối 1 MB.
+    """
+    tmp_path = output_file + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for segment in segments:
+            if isinstance(segment, (bytes, bytearray)):
+                out.write(segment)
+                continue
+            path, start, end = segment
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    block = f.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        break
+                    out.write(block)
+                    remaining -= len(block)
+    os.replace(tmp_path, output_file)
+
+
+def concat_mp3_files(input_files: list, output_file: str, infos: list = None) -> bool:
+    """
+    Nối các file MP3 cùng thông số theo từng frame, không giải mã lại.
+    Chỉ giữ một buffer copy cố định nên bộ nhớ không phụ thuộc độ dài sách.
+    Trả về False (không ghi gì) nếu có file không đọc được hoặc khác thông số.
+    """
+    if infos is None:
+        infos = [read_mp3_info(path) for path in input_files]
+    if not infos or any(info is None for info in infos):
+        return False
+    if len({codec_params(info) for info in infos}) != 1:
+        return False
+
+    concat_mp3_segments(
+        [(path, info["audio_start"], info["audio_end"]) for path, info in zip(input_files, infos)],
+        output_file
+    )
+    return True
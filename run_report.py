@@ -0,0 +1,215 @@
+"""
+Đo thời gian, thông lượng và bộ nhớ của từng stage trong pipeline.
+
+Các module gọi `span("tên", **attrs)` quanh mỗi bước; khi chưa bật báo cáo
+(start_report) thì span không làm gì. Attr dạng số được cộng dồn theo tên
+span (xem SUMMED_ATTRS) để tính thông lượng:
+    chars          -> ký tự/giây (TTS)
+    audio_seconds  -> realtime factor (Whisper: giây xử lý / giây audio)
+    frames         -> fps (ffmpeg encode)
+
+Kết quả xuất ra JSON (write_json) và text kiểu Prometheus (write_prometheus)
+để so sánh giữa các bản phát hành, vd.:
+    python batch_runner.py books/ --report run.json --prometheus run.prom
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Attr được cộng dồn trong summary; các attr khác (vd. số thứ tự chương) chỉ nằm trong span
+SUMMED_ATTRS = ("chars", "chapters", "files", "audio_seconds", "frames")
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def windows_peak_working_set() -> int:
+    """Working set cao nhất của process hiện tại qua GetProcessMemoryInfo (Windows, không cần psutil)."""
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    try:
+        kernel32 = ctypes.WinDLL("kernel32")
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        get_info = kernel32.K32GetProcessMemoryInfo
+    except (AttributeError, OSError):
+        return None
+    get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    get_info.restype = wintypes.BOOL
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    if not get_info(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+def peak_rss_bytes(children: bool = False) -> int:
+    """
+    RSS cao nhất của process (hoặc các process con như ffmpeg); None nếu không
+    đo được (vd. process con trên Windows), để báo cáo ghi null thay vì 0.
+    """
+    if sys.platform == "win32":
+        return None if children else windows_peak_working_set()
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss tính theo KB trên Linux, theo byte trên macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    peak = peak_rss_bytes(children)
+    return None if peak is None else round(peak / 1024 ** 2, 1)
+
+
+class RunReport:
+    def __init__(self, name: str = "text-to-speech"):
+        self.name = name
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration: float, attrs: dict):
+        with self.lock:
+            self.spans.append({
+                "name": name,
+                "start_s": round(start - self.origin, 3),
+                "duration_s": round(duration, 3),
+                "thread": threading.current_thread().name,
+                "peak_rss_mb": peak_rss_mb(),
+                "attrs": attrs,
+            })
+
+    def summary(self) -> dict:
+        """Gộp theo tên span: số lần, tổng/max thời gian, tổng các attr số và thông lượng suy ra."""
+        with self.lock:
+            spans = list(self.spans)
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span["name"], {"count": 0, "total_s": 0.0, "max_s": 0.0, "totals": {}})
+            stage["count"] += 1
+            stage["total_s"] += span["duration_s"]
+            stage["max_s"] = max(stage["max_s"], span["duration_s"])
+            for key in SUMMED_ATTRS:
+                if key in span["attrs"]:
+                    stage["totals"][key] = stage["totals"].get(key, 0) + span["attrs"][key]
+
+        for stage in stages.values():
+            totals = stage["totals"]
+            seconds = stage["total_s"]
+            if seconds and totals.get("chars"):
+                stage["chars_per_second"] = round(totals["chars"] / seconds, 1)
+            if totals.get("audio_seconds"):
+                stage["realtime_factor"] = round(seconds / totals["audio_seconds"], 3)
+            if seconds and totals.get("frames"):
+                stage["fps"] = round(totals["frames"] / seconds, 1)
+            stage["total_s"] = round(stage["total_s"], 3)
+        return stages
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_s": round(time.perf_counter() - self.origin, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "children_peak_rss_mb": peak_rss_mb(children=True),
+            "summary": self.summary(),
+            "spans": list(self.spans),
+        }
+
+    def write_json(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def to_prometheus(self, prefix: str = "tts_pipeline") -> str:
+        data = self.to_dict()
+        lines = [
+            f"# TYPE {prefix}_run_seconds gauge",
+            f"{prefix}_run_seconds {data['duration_s']}",
+        ]
+        # Bộ nhớ không đo được thì bỏ metric, không ghi 0
+        rss = [
+            (label, data[key])
+            for label, key in (("", "peak_rss_mb"), ('{process="children"}', "children_peak_rss_mb"))
+            if data[key] is not None
+        ]
+        if rss:
+            lines.append(f"# TYPE {prefix}_peak_rss_bytes gauge")
+            lines.extend(f"{prefix}_peak_rss_bytes{label} {int(value * 1024 ** 2)}" for label, value in rss)
+        metrics = [
+            ("stage_seconds_total", "counter", "total_s"),
+            ("stage_runs_total", "counter", "count"),
+            ("stage_seconds_max", "gauge", "max_s"),
+            ("chars_per_second", "gauge", "chars_per_second"),
+            ("realtime_factor", "gauge", "realtime_factor"),
+            ("encode_fps", "gauge", "fps"),
+        ]
+        for metric, kind, key in metrics:
+            rows = [(name, stage[key]) for name, stage in sorted(data["summary"].items()) if key in stage]
+            if rows:
+                lines.append(f"# TYPE {prefix}_{metric} {kind}")
+                lines.extend(f'{prefix}_{metric}{{stage="{name}"}} {value}' for name, value in rows)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+
+def start_report(name: str = "text-to-speech") -> RunReport:
+    """Bật ghi nhận cho cả process; các span từ mọi thread đều vào báo cáo này."""
+    global _active
+    with _active_lock:
+        _active = RunReport(name)
+        return _active
+
+
+def stop_report() -> RunReport:
+    global _active
+    with _active_lock:
+        report, _active = _active, None
+        return report
+
+
+def current_report() -> RunReport:
+    return _active
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Đo một bước. Trả về dict attrs để bổ sung số liệu chỉ biết khi chạy xong,
+    vd. `with span("ffmpeg.render") as s: ...; s["frames"] = n`.
+    """
+    report = _active
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException:
+        attrs["failed"] = True
+        raise
+    finally:
+        if report is not None:
+            report.add(name, start, time.perf_counter() - start, attrs)
@@ -0,0 +1,340 @@
+"""
+Phân tích khoảng lặng theo năng lượng (VAD đơn giản bằng NumPy) cho các file
+part và chuẩn hóa khoảng nghỉ giữa các chương khi gộp.
+
+edge-tts trả về mỗi part với khoảng lặng đầu/cuối tùy ý, nên khi gộp nối tiếp
+khoảng nghỉ giữa các chương không đều. merge_with_pacing cắt bớt hoặc chèn
+frame im lặng để mọi chỗ nối chương có đúng `chapter_pause` giây, vẫn nối theo
+frame MP3 (không encode lại).
+
+Kết quả phân tích được ghi thành `<base>-silence.json` (silence map) theo thời
+gian của file gộp: các khoảng lặng và vị trí từng chương. Stage phụ đề dùng lại
+làm điểm cắt khi chạy Whisper song song (cut_points_from_map) thay vì giải mã
+và tính năng lượng lại cả file.
+"""
+import bisect
+import json
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from media_probe import find_tool
+from mp3_frames import (
+    codec_params, concat_mp3_segments, frame_offsets, frame_seconds, parse_frame_header, read_mp3_info, scan_mp3
+)
+
+SAMPLE_RATE = 8000
+FRAME_MS = 10
+MIN_PAUSE_SECONDS = 0.15
+# Frame to hơn mức này luôn tính là tiếng nói, kể cả khi ngưỡng tự động cao hơn
+MAX_SILENCE_DB = -35.0
+# Tiếng nói phải kéo dài ít nhất chừng này frame (bỏ qua tiếng click lẻ)
+MIN_SPEECH_FRAMES = 3
+
+
+def audio_energy_db(
+    audio_file: str,
+    frame_ms: int = FRAME_MS,
+    sample_rate: int = SAMPLE_RATE,
+    block_seconds: float = 60.0
+):
+    """
+    Năng lượng (dB) của từng frame `frame_ms`, tính bằng NumPy trên PCM mono do
+    ffmpeg giải mã. Đọc theo khối nên không giữ cả file audio trong bộ nhớ.
+    """
+    import numpy as np
+
+    frame = sample_rate * frame_ms // 1000
+    frame_bytes = frame * 2
+    block_bytes = frame_bytes * int(block_seconds * 1000 / frame_ms)
+    cmd = [find_tool("ffmpeg"), "-v", "error", "-i", audio_file,
+           "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "-"]
+    blocks = []
+    rest = b""
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            data = rest + data
+            usable = len(data) - len(data) % frame_bytes
+            rest = data[usable:]
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768
+            power = np.mean(samples.reshape(-1, frame) ** 2, axis=1)
+            blocks.append(10 * np.log10(np.maximum(power, 1e-10)))
+        stderr = process.stderr.read()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg không giải mã được {audio_file}: {stderr.decode('utf-8', errors='replace')[-300:]}")
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+
+def speech_threshold_db(energy_db) -> float:
+    """Ngưỡng tiếng nói/khoảng lặng từ phân bố năng lượng (giữa nền nhiễu và mức nói)."""
+    import numpy as np
+
+    floor, peak = np.percentile(energy_db, [3, 95])
+    return float(min(floor + 0.35 * (peak - floor), MAX_SILENCE_DB))
+
+
+def find_pauses(
+    energy_db,
+    frame_ms: int = FRAME_MS,
+    min_pause: float = MIN_PAUSE_SECONDS,
+    threshold_db: float = None
+) -> list:
+    """Các khoảng lặng [(start, end), ...] (giây) dài ít nhất `min_pause`, theo thứ tự thời gian."""
+    import numpy as np
+
+    if not len(energy_db):
+        return []
+    if threshold_db is None:
+        threshold_db = speech_threshold_db(energy_db)
+    silent = (energy_db < threshold_db).astype(np.int8)
+    edges = np.diff(np.concatenate(([0], silent, [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) * frame_ms >= min_pause * 1000
+    step = frame_ms / 1000
+    return [(start * step, end * step) for start, end in zip(starts[keep].tolist(), ends[keep].tolist())]
+
+
+def analyze_audio(audio_file: str, frame_ms: int = FRAME_MS, min_pause: float = MIN_PAUSE_SECONDS) -> dict:
+    """
+    Trả về {"duration", "threshold_db", "lead", "trail", "pauses"} (giây):
+    `lead`/`trail` là khoảng lặng ở đầu/cuối file (0 nếu file không có tiếng nói).
+    """
+    import numpy as np
+
+    energy = audio_energy_db(audio_file, frame_ms)
+    step = frame_ms / 1000
+    duration = len(energy) * step
+    if not len(energy):
+        return {"duration": 0.0, "threshold_db": 0.0, "lead": 0.0, "trail": 0.0, "pauses": []}
+    threshold = speech_threshold_db(energy)
+    speech = energy >= threshold
+    # Frame thuộc một đoạn tiếng nói đủ dài
+    runs = np.convolve(speech, np.ones(MIN_SPEECH_FRAMES, dtype=int), "valid") >= MIN_SPEECH_FRAMES
+    voiced = np.flatnonzero(runs)
+    if len(voiced):
+        lead = voiced[0] * step
+        trail = max(duration - (voiced[-1] + MIN_SPEECH_FRAMES) * step, 0.0)
+    else:
+        lead = trail = 0.0
+    return {
+        "duration": duration,
+        "threshold_db": round(threshold, 1),
+        "lead": lead,
+        "trail": trail,
+        "pauses": find_pauses(energy, frame_ms, min_pause, threshold),
+    }
+
+
+def analyze_parts(audio_files: list, workers: int = None, log_func=print) -> list:
+    """Phân tích song song các file part (mỗi file một process ffmpeg)."""
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=min(workers, max(len(audio_files), 1))) as pool:
+        analyses = list(pool.map(analyze_audio, audio_files))
+    silence = sum(entry["lead"] + entry["trail"] for entry in analyses)
+    log_func(f"🔇 Đã phân tích khoảng lặng {len(audio_files)} part: {silence:.1f}s lặng ở đầu/cuối các part")
+    return analyses
+
+
+def silence_frames(info: dict, seconds: float) -> list:
+    """
+    Sinh các frame MP3 im lặng cùng thông số với `info` (dùng ffmpeg), dài ít nhất `seconds`.
+    Encode CBR đúng bitrate của các part để file gộp vẫn là CBR.
+    """
+    _, _, bitrate, sample_rate, channels = codec_params(info)
+    result = subprocess.run([
+        find_tool("ffmpeg"), "-v", "error",
+        "-f", "lavfi", "-i", f"anullsrc=r={sample_rate}:cl={'mono' if channels == 1 else 'stereo'}",
+        "-t", f"{seconds + 0.5:.3f}",
+        "-c:a", "libmp3lame", "-b:a", f"{bitrate // 1000}k", "-write_xing", "0", "-id3v2_version", "0", "-f", "mp3", "-"
+    ], capture_output=True)
+    data = result.stdout
+    silent = scan_mp3(data) if result.returncode == 0 else None
+    if not silent or codec_params(silent) != codec_params(info):
+        raise RuntimeError("Không tạo được frame im lặng cùng thông số với các part")
+
+    # Tách theo header từng frame (độ dài frame có thể khác nhau vì padding)
+    frames = []
+    pos = silent["audio_start"]
+    while pos < silent["audio_end"]:
+        header = parse_frame_header(data[pos:pos + 4])
+        if not header:
+            break
+        frames.append(data[pos:pos + header["length"]])
+        pos += header["length"]
+    return frames
+
+
+def plan_pacing(analyses: list, infos: list, chapter_pause: float) -> list:
+    """
+    Tính cho từng part: số frame im lặng chèn trước (`pad_frames`) và khoảng
+    frame giữ lại [cut_start, cut_end), sao cho từ cuối tiếng nói chương trước
+    tới đầu tiếng nói chương sau là `chapter_pause` giây (sai số một frame).
+    Đầu và cuối sách giữ tối đa chapter_pause / 2 khoảng lặng.
+    """
+    half = chapter_pause / 2
+    plans = []
+    keep_trail_prev = 0.0
+    for i, (analysis, info) in enumerate(zip(analyses, infos)):
+        frame = frame_seconds(info)
+        lead, trail = analysis["lead"], analysis["trail"]
+        if i == 0:
+            keep_lead = min(lead, half)
+            pad = 0.0
+        else:
+            keep_lead = min(lead, chapter_pause - keep_trail_prev)
+            pad = chapter_pause - keep_trail_prev - keep_lead
+        keep_trail = min(trail, half)
+        cut_start = int((lead - keep_lead) / frame)
+        cut_end = info["frames"] - int((trail - keep_trail) / frame)
+        plans.append({
+            "pad_frames": int(round(pad / frame)),
+            "cut_start": cut_start,
+            "cut_end": max(cut_end, cut_start),
+            "frame_seconds": frame,
+        })
+        keep_trail_prev = keep_trail
+    return plans
+
+
+def merge_with_pacing(
+    output_file: str,
+    audio_files: list,
+    analyses: list,
+    chapter_pause: float,
+    infos: list = None,
+    log_func=print
+) -> list:
+    """
+    Gộp các part theo frame MP3 với khoảng nghỉ giữa các chương đã chuẩn hóa.
+    Trả về layout từng chương {"duration_ms", "shift_ms", "pad_ms", "cut_start_ms"}:
+    thời điểm t (ms) trong part nằm ở offset_chương + shift_ms + t trong file gộp.
+    Trả về None nếu các part không nối frame được (khác thông số, không đọc được).
+    """
+    infos = [info or read_mp3_info(path) for info, path in zip(infos or [None] * len(audio_files), audio_files)]
+    if not infos or any(info is None for info in infos) or len({codec_params(info) for info in infos}) != 1:
+        log_func("⚠️ Các part khác thông số codec, không chuẩn hóa khoảng nghỉ được")
+        return None
+
+    plans = plan_pacing(analyses, infos, chapter_pause)
+    max_pad = max(plan["pad_frames"] for plan in plans)
+    padding = silence_frames(infos[0], max_pad * plans[0]["frame_seconds"]) if max_pad else []
+    if len(padding) < max_pad:
+        log_func("⚠️ Không đủ frame im lặng để chèn, không chuẩn hóa khoảng nghỉ")
+        return None
+
+    segments = []
+    layout = []
+    trimmed = 0.0
+    for path, info, plan in zip(audio_files, infos, plans):
+        frame_ms = plan["frame_seconds"] * 1000
+        if plan["pad_frames"]:
+            # Lấy các frame đầu của luồng im lặng: luôn giải mã được vì không tham chiếu frame phía trước
+            segments.append(b"".join(padding[:plan["pad_frames"]]))
+        offsets = frame_offsets(path, info)
+        cut_end = min(plan["cut_end"], len(offsets) - 1)
+        segments.append((path, offsets[plan["cut_start"]], offsets[cut_end]))
+        kept = cut_end - plan["cut_start"]
+        trimmed += (info["frames"] - kept) * frame_ms / 1000
+        pad_ms = plan["pad_frames"] * frame_ms
+        cut_start_ms = plan["cut_start"] * frame_ms
+        layout.append({
+            "duration_ms": pad_ms + kept * frame_ms,
+            "shift_ms": pad_ms - cut_start_ms,
+            "pad_ms": pad_ms,
+            "cut_start_ms": cut_start_ms,
+        })
+
+    concat_mp3_segments(segments, output_file)
+    added = sum(entry["pad_ms"] for entry in layout) / 1000
+    log_func(f"⏸️ Chuẩn hóa khoảng nghỉ giữa chương = {chapter_pause:g}s: cắt {trimmed:.1f}s, chèn {added:.1f}s im lặng")
+    return layout
+
+
+def build_silence_map(analyses: list, layout: list, chapter_pause: float = None) -> dict:
+    """Gộp khoảng lặng của các part theo thời gian của file gộp (khoảng lặng liền nhau ở chỗ nối được nối lại)."""
+    chapters = []
+    pauses = []
+    offset = 0.0
+
+    def add_pause(start, end):
+        if pauses and start <= pauses[-1][1] + 1e-3:
+            pauses[-1][1] = max(pauses[-1][1], end)
+        elif end - start >= MIN_PAUSE_SECONDS:
+            pauses.append([start, end])
+
+    for analysis, entry in zip(analyses, layout):
+        duration = entry["duration_ms"] / 1000
+        shift = entry["shift_ms"] / 1000
+        pad = entry["pad_ms"] / 1000
+        kept_start = entry["cut_start_ms"] / 1000
+        kept_end = kept_start + duration - pad
+        if pad:
+            add_pause(offset, offset + pad)
+        for start, end in analysis["pauses"]:
+            start, end = max(start, kept_start), min(end, kept_end)
+            if end > start:
+                add_pause(offset + shift + start, offset + shift + end)
+        chapters.append({
+            "start": round(offset, 3),
+            "end": round(offset + duration, 3),
+            "speech_start": round(offset + shift + max(analysis["lead"], kept_start), 3),
+            "speech_end": round(offset + shift + min(analysis["duration"] - analysis["trail"], kept_end), 3),
+        })
+        offset += duration
+
+    return {
+        "duration": round(offset, 3),
+        "frame_ms": FRAME_MS,
+        "min_pause": MIN_PAUSE_SECONDS,
+        "chapter_pause": chapter_pause,
+        "chapters": chapters,
+        "pauses": [[round(start, 3), round(end, 3)] for start, end in pauses],
+    }
+
+
+def silence_map_path(output_dir: str, base_name: str) -> str:
+    return os.path.join(output_dir, f"{base_name}-silence.json")
+
+
+def write_silence_map(path: str, silence_map: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(silence_map, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_silence_map(path: str) -> dict:
+    """Đọc silence map; None nếu không có hoặc hỏng."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            silence_map = json.load(f)
+        return silence_map if isinstance(silence_map.get("pauses"), list) else None
+    except (OSError, ValueError):
+        return None
+
+
+def cut_points_from_map(silence_map: dict, window_seconds: float = 300.0, search_seconds: float = 10.0) -> list:
+    """
+    Điểm cắt (giây) gần mỗi mốc `window_seconds`, chọn giữa khoảng lặng dài nhất
+    trong ±search_seconds (cùng cách dùng với find_silence_cut_points của
+    subtitle_generator nhưng không cần giải mã audio).
+    """
+    pauses = silence_map["pauses"]
+    centers = [(start + end) / 2 for start, end in pauses]
+    duration = silence_map["duration"]
+    cuts = []
+    target = window_seconds
+    while target < duration - search_seconds:
+        lo = bisect.bisect_left(centers, target - search_seconds)
+        hi = bisect.bisect_right(centers, target + search_seconds)
+        if hi > lo:
+            best = max(range(lo, hi), key=lambda i: pauses[i][1] - pauses[i][0])
+            cuts.append(centers[best])
+        else:
+            cuts.append(target)
+        target = cuts[-1] + window_seconds
+    return cuts
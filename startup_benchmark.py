@@ -0,0 +1,146 @@
+"""
+Đo thời gian khởi động của GUI và pipeline, mỗi lần đo chạy trong process mới
+(import lạnh như khi người dùng mở app):
+
+    window         từ lúc chạy process tới khi cửa sổ chính hiện lên
+    first_chapter  từ lúc chạy process tới khi chương đầu tiên tổng hợp xong
+                   (import convert + làm sạch text + TTS, cache rỗng)
+
+Có mục tiêu (WINDOW_TARGET_SECONDS, FIRST_CHAPTER_TARGET_SECONDS); với --check
+script trả exit code 1 khi vượt, dùng được trong CI hoặc trước khi phát hành:
+
+    python startup_benchmark.py --check
+    python startup_benchmark.py --exe dist/dautay.exe --check   # bản PyInstaller
+    python startup_benchmark.py --profile                      # module import chậm nhất
+
+Đo trên máy không có màn hình: đặt QT_QPA_PLATFORM=offscreen.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+WINDOW_TARGET_SECONDS = 1.5
+FIRST_CHAPTER_TARGET_SECONDS = 5.0
+
+# Trùng với app_gui.STARTUP_PROBE_ENV (không import app_gui để khỏi nạp PyQt5 vào process đo)
+STARTUP_PROBE_ENV = "TTS_STARTUP_PROBE"
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Chạy trong process con: convert một sách 2 chương, ghi thời điểm chương đầu xong rồi hủy phần còn lại
+FIRST_CHAPTER_SCRIPT = """
+import sys, threading, time
+probe_path, input_file, cache_dir, backend = sys.argv[1:5]
+from convert import convert_text_file_to_speech
+cancel_event = threading.Event()
+
+def progress_func(index, done, total):
+    if done >= total and not cancel_event.is_set():
+        with open(probe_path, "w", encoding="utf-8") as f:
+            f.write(repr(time.time()))
+        cancel_event.set()
+
+convert_text_file_to_speech(input_file, cache_dir=cache_dir, backend=backend, log_func=lambda msg: None,
+                            cancel_event=cancel_event, progress_func=progress_func)
+"""
+
+
+def run_probe(cmd: list, probe_path: str, timeout: float = 120, env: dict = None) -> float:
+    """Chạy `cmd`, trả về số giây từ lúc start tới thời điểm process con ghi vào `probe_path`."""
+    if os.path.exists(probe_path):
+        os.remove(probe_path)
+    started = time.time()
+    result = subprocess.run(cmd, cwd=APP_DIR, env=env, timeout=timeout,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        with open(probe_path, "r", encoding="utf-8") as f:
+            return float(f.read()) - started
+    except (OSError, ValueError):
+        stderr = result.stderr.decode("utf-8", errors="replace")[-500:]
+        raise RuntimeError(f"Process không ghi mốc thời gian (exit {result.returncode}): {stderr}")
+
+
+def measure_window(exe: str = None, runs: int = 3) -> list:
+    """Thời gian tới khi cửa sổ hiện, chạy app_gui.py từ source hoặc file `exe` đã đóng gói."""
+    cmd = [exe] if exe else [sys.executable, os.path.join(APP_DIR, "app_gui.py")]
+    times = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        probe_path = os.path.join(tmp_dir, "window.txt")
+        env = dict(os.environ, **{STARTUP_PROBE_ENV: probe_path})
+        for _ in range(runs):
+            times.append(run_probe(cmd, probe_path, env=env))
+    return times
+
+
+def measure_first_chapter(backend: str = "tone", runs: int = 1) -> list:
+    """Thời gian tới khi chương đầu tiên tổng hợp xong, với cache và thư mục output mới mỗi lần."""
+    times = []
+    for run in range(runs):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "startup.txt")
+            with open(input_file, "w", encoding="utf-8") as f:
+                for i in (1, 2):
+                    f.write(f"#Chương {i}#\nĐây là chương {i} của lần đo {run}, dùng để đo thời gian khởi động.\n")
+            probe_path = os.path.join(tmp_dir, "chapter.txt")
+            cmd = [sys.executable, "-c", FIRST_CHAPTER_SCRIPT,
+                   probe_path, input_file, os.path.join(tmp_dir, "cache"), backend]
+            times.append(run_probe(cmd, probe_path))
+    return times
+
+
+def import_profile(module: str = "app_gui", top: int = 15) -> list:
+    """
+    Chạy `python -X importtime -c "import <module>"` và trả về các module tốn
+    thời gian nhất (cộng dồn cả module con): [(giây, tên module), ...].
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=APP_DIR, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        try:
+            rows.append((int(parts[1]) / 1e6, parts[2].strip()))
+        except (IndexError, ValueError):
+            continue  # dòng tiêu đề
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động GUI và chương đầu tiên")
+    parser.add_argument("--exe", help="File chạy đã đóng gói (PyInstaller) thay cho app_gui.py")
+    parser.add_argument("--runs", type=int, default=3, help="Số lần đo cửa sổ (lấy trung vị)")
+    parser.add_argument("--backend", default="tone", help="TTS backend khi đo chương đầu (mặc định: tone, không cần mạng)")
+    parser.add_argument("--skip-chapter", action="store_true", help="Chỉ đo thời gian mở cửa sổ")
+    parser.add_argument("--profile", action="store_true", help="In các module import chậm nhất của app_gui")
+    parser.add_argument("--check", action="store_true", help="Exit code 1 nếu vượt mục tiêu")
+    args = parser.parse_args()
+
+    if args.profile:
+        print("🔎 Import chậm nhất (cộng dồn):")
+        for seconds, name in import_profile():
+            print(f"   {seconds * 1000:8.1f} ms  {name}")
+
+    failed = False
+    window = statistics.median(measure_window(args.exe, args.runs))
+    ok = window <= WINDOW_TARGET_SECONDS
+    failed |= not ok
+    print(f"{'✅' if ok else '❌'} Cửa sổ hiện sau {window:.2f}s (mục tiêu {WINDOW_TARGET_SECONDS}s)")
+
+    if not args.skip_chapter:
+        chapter = statistics.median(measure_first_chapter(args.backend))
+        ok = chapter <= FIRST_CHAPTER_TARGET_SECONDS
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} Chương đầu tiên xong sau {chapter:.2f}s "
+              f"(backend {args.backend}, mục tiêu {FIRST_CHAPTER_TARGET_SECONDS}s)")
+
+    return 1 if failed and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,41 @@
 import os
 import tempfile
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Callable, Optional
-import whisper
-import torch
 
+from run_report import span
+from silence_map import FRAME_MS, MIN_PAUSE_SECONDS, audio_energy_db, find_pauses, speech_threshold_db
+from subtitle_segmenter import (
+    MAX_CUE_SECONDS, MAX_LINE_CHARS, cues_from_result, cues_from_words, count_fast_cues,
+    format_srt_timestamp, write_subtitles
+)
 
-def generate_subtitle(audio_file: str, model_name: str = "base", log_func: Optional[Callable[[str], None]] = None) -> str:
+# Dung lượng ước tính (MB) của từng model, dùng cho giới hạn bộ nhớ của cache model
+MODEL_SIZES_MB = {
+    "tiny": 39,
+    "base": 74,
+    "small": 244,
+    "medium": 769,
+    "large": 1550,
+}
+
+# Cache model dùng chung trong process: (model_name, device) -> model, theo thứ tự LRU
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+model_cache_max_mb = 2000
+
+
+def generate_subtitle(
+    audio_file: str,
+    model_name: str = "base",
+    log_func: Optional[Callable[[str], None]] = None,
+    parallel_workers: int = 0,
+    formats: tuple = ("srt",),
+    silence_map: Optional[str] = None
+) -> str:
     """
     Tạo file phụ đề SRT từ file audio sử dụng Whisper local
     
@@ -14,6 +43,10 @@ def generate_subtitle(audio_file: str, model_name: str = "base", log_func: Optio
         audio_file: Đường dẫn đến file audio
         model_name: Tên model Whisper (tiny, base, small, medium, large)
         log_func: Hàm callback để log thông tin
+        parallel_workers: > 1 để chia audio theo khoảng lặng và transcribe song song trên CPU
+        formats: Các định dạng ghi ra cạnh file SRT ("srt", "vtt", "ass")
+        silence_map: File -silence.json của audio (xem silence_map.py); khi chạy song song
+            thì lấy điểm cắt từ đây thay vì tính năng lượng lại
         
     Returns:
         Đường dẫn đến file SRT đã tạo
@@ -35,15 +68,29 @@ def generate_subtitle(audio_file: str, model_name: str = "base", log_func: Optio
     srt_file = f"{base_name}.srt"
     
     try:
-        # Load model
-        model = load_whisper_model(model_name, log_func)
-        
-        # Transcribe audio
-        log("🎤 Đang chuyển đổi audio thành text...")
-        result = transcribe_audio_local(model, audio_file, log_func)
+        with span("whisper", model=model_name, workers=max(1, parallel_workers),
+                  audio_seconds=audio_seconds(audio_file)):
+            if parallel_workers > 1:
+                log("🎤 Đang chuyển đổi audio thành text (song song)...")
+                cut_points = None
+                if silence_map:
+                    from silence_map import cut_points_from_map, load_silence_map
+
+                    loaded = load_silence_map(silence_map)
+                    if loaded:
+                        cut_points = cut_points_from_map(loaded)
+                result = transcribe_audio_parallel(audio_file, model_name, parallel_workers,
+                                                   log_func=log_func, cut_points=cut_points)
+            else:
+                # Load model
+                model = load_whisper_model(model_name, log_func)
+
+                # Transcribe audio
+                log("🎤 Đang chuyển đổi audio thành text...")
+                result = transcribe_audio_local(model, audio_file, log_func)
         
         # Tạo file SRT từ result
-        create_srt_file(result, srt_file, log_func)
+        create_srt_file(result, srt_file, log_func, formats)
         
         log(f"✅ Đã tạo phụ đề: {srt_file}")
         return srt_file
@@ -53,9 +100,22 @@ def generate_subtitle(audio_file: str, model_name: str = "base", log_func: Optio
         raise
 
 
-def load_whisper_model(model_name: str, log_func: Optional[Callable[[str], None]] = None):
+def audio_seconds(audio_file: str) -> float:
+    """Độ dài audio cho báo cáo hiệu năng (realtime factor); 0 nếu không đọc được."""
+    from media_probe import get_duration
+
+    try:
+        return get_duration(audio_file)
+    except (OSError, RuntimeError):
+        return 0.0
+
+
+def load_whisper_model(model_name: str, log_func: Optional[Callable[[str], None]] = None, device: Optional[str] = None):
     """
     Load Whisper model với thông báo tiến trình
+
+    Model đã tải được giữ lại trong cache của process theo (model_name, device),
+    nên các lần gọi sau (vd. chạy batch nhiều file) không phải tải lại.
     """
     def log(msg: str):
         if log_func:
@@ -63,9 +123,20 @@ def load_whisper_model(model_name: str, log_func: Optional[Callable[[str], None]
         else:
             print(msg)
     
+    import whisper
+    import torch
+
     # Kiểm tra GPU
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
     log(f"🔧 Sử dụng device: {device}")
+
+    key = (model_name, device)
+    with _model_cache_lock:
+        if key in _model_cache:
+            _model_cache.move_to_end(key)
+            log(f"♻️ Dùng lại model '{model_name}' đã tải")
+            return _model_cache[key]
     
     # Thông tin về các model
     model_info = {
@@ -81,11 +152,36 @@ def load_whisper_model(model_name: str, log_func: Optional[Callable[[str], None]
     try:
         model = whisper.load_model(model_name, device=device)
         log(f"✅ Đã tải model '{model_name}' thành công!")
-        return model
     except Exception as e:
         log(f"❌ Lỗi khi tải model: {str(e)}")
         raise
 
+    with _model_cache_lock:
+        _model_cache[key] = model
+        evict_whisper_models(log)
+    return model
+
+
+def evict_whisper_models(log: Callable[[str], None] = print):
+    """Bỏ các model dùng lâu nhất khi tổng dung lượng vượt model_cache_max_mb (luôn giữ model mới nhất)."""
+    def size_of(key):
+        return MODEL_SIZES_MB.get(key[0], MODEL_SIZES_MB["large"])
+
+    total = sum(size_of(key) for key in _model_cache)
+    while len(_model_cache) > 1 and total > model_cache_max_mb:
+        key, _ = _model_cache.popitem(last=False)
+        total -= size_of(key)
+        log(f"🗑️ Giải phóng model '{key[0]}' ({key[1]})")
+        if key[1] == "cuda":
+            import torch
+            torch.cuda.empty_cache()
+
+
+def clear_whisper_models():
+    """Giải phóng toàn bộ model đang giữ trong cache."""
+    with _model_cache_lock:
+        _model_cache.clear()
+
 
 def transcribe_audio_local(model, audio_file: str, log_func: Optional[Callable[[str], None]] = None) -> dict:
     """
@@ -111,56 +207,507 @@ def transcribe_audio_local(model, audio_file: str, log_func: Optional[Callable[[
     return result
 
 
-def create_srt_file(result: dict, output_file: str, log_func: Optional[Callable[[str], None]] = None):
+WHISPER_SAMPLE_RATE = 16000
+
+
+def find_silence_cut_points(
+    audio,
+    window_seconds: float = 300.0,
+    search_seconds: float = 10.0,
+    frame_ms: int = 20,
+    sample_rate: int = WHISPER_SAMPLE_RATE
+) -> list:
+    """
+    Chọn điểm cắt (giây) gần mỗi mốc `window_seconds`, tại frame có năng lượng
+    thấp nhất trong khoảng ±search_seconds để không cắt giữa một từ.
+    """
+    import numpy as np
+
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return []
+    energy = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+
+    duration = len(audio) / sample_rate
+    frames_per_second = 1000 / frame_ms
+    cuts = []
+    target = window_seconds
+    while target < duration - search_seconds:
+        lo = int((target - search_seconds) * frames_per_second)
+        hi = int((target + search_seconds) * frames_per_second)
+        quietest = lo + int(np.argmin(energy[lo:hi]))
+        cuts.append(quietest / frames_per_second)
+        target = cuts[-1] + window_seconds
+    return cuts
+
+
+# Điểm thưởng cho khoảng lặng dài khi chọn ranh giới câu (tính trên mỗi giây lặng, tối đa 1s)
+PAUSE_WEIGHT = 2.0
+
+
+def split_units(words: list, end_marks: str) -> list:
+    """Nhóm các từ thành câu/mệnh đề, cắt sau từ kết thúc bằng một ký tự trong `end_marks`."""
+    units = []
+    current = []
+    for word in words:
+        current.append(word)
+        if word[-1] in end_marks:
+            units.append(current)
+            current = []
+    if current:
+        units.append(current)
+    return units
+
+
+class SpeechTimeline:
+    """Tra cứu nhanh khoảng lặng và lượng tiếng nói tích lũy trên toàn bộ audio."""
+
+    def __init__(self, energy_db, frame_ms: int = FRAME_MS, min_pause: float = MIN_PAUSE_SECONDS):
+        import numpy as np
+
+        self.step = frame_ms / 1000
+        threshold = speech_threshold_db(energy_db) if len(energy_db) else 0.0
+        self.pauses = find_pauses(energy_db, frame_ms, min_pause, threshold)
+        self.pause_starts = [start for start, _ in self.pauses]
+        self.cum_speech = np.cumsum(energy_db >= threshold) * self.step
+        self.duration = len(energy_db) * self.step
+
+    def speech_at(self, t: float) -> float:
+        """Số giây có tiếng nói từ đầu audio tới thời điểm t."""
+        if not len(self.cum_speech):
+            return 0.0
+        return float(self.cum_speech[min(max(int(t / self.step), 0), len(self.cum_speech) - 1)])
+
+    def time_at(self, amount: float) -> float:
+        """Thời điểm lượng tiếng nói tích lũy đạt `amount` giây."""
+        import numpy as np
+
+        index = int(np.searchsorted(self.cum_speech, amount))
+        return min(index, max(len(self.cum_speech) - 1, 0)) * self.step
+
+    def pauses_between(self, start: float, end: float) -> list:
+        """Khoảng lặng nằm trọn trong (start, end)."""
+        import bisect
+
+        lo = bisect.bisect_right(self.pause_starts, start)
+        hi = bisect.bisect_left(self.pause_starts, end)
+        return [pause for pause in self.pauses[lo:hi] if pause[1] < end]
+
+    def trim(self, start: float, end: float) -> tuple:
+        """Bỏ khoảng lặng ở đầu và cuối đoạn [start, end]."""
+        import bisect
+
+        i = bisect.bisect_right(self.pause_starts, start) - 1
+        if i >= 0 and self.pauses[i][1] > start:
+            start = min(self.pauses[i][1], end)
+        i = bisect.bisect_left(self.pause_starts, end) - 1
+        if i >= 0 and self.pauses[i][1] >= end - self.step:
+            end = max(self.pauses[i][0], start)
+        return start, end
+
+
+def anchor_units(units: list, start: float, end: float, timeline: SpeechTimeline) -> list:
+    """
+    Chia [start, end] cho các câu/mệnh đề liên tiếp. Lượng tiếng nói của mỗi đơn
+    vị được dự đoán theo số ký tự và tốc độ nói trung bình của cả đoạn, rồi ranh
+    giới được neo vào khoảng lặng có chi phí thấp nhất: độ lệch so với dự đoán
+    (đo bằng giây có tiếng, nên các khoảng lặng khác không làm lệch) trừ điểm
+    thưởng cho khoảng lặng dài. Mỗi ranh giới dự đoán lại từ ranh giới trước nên
+    sai số không cộng dồn.
+    Trả về [(start, end), ...] cho từng đơn vị.
+    """
+    chars = [sum(len(word) + 1 for word in unit) for unit in units]
+    rate = (timeline.speech_at(end) - timeline.speech_at(start)) / max(sum(chars), 1)
+    pauses = timeline.pauses_between(start, end)
+    spans = []
+    unit_start = start
+    j = 0
+    for k, unit_chars in enumerate(chars):
+        if k == len(chars) - 1:
+            spans.append((unit_start, max(end, unit_start)))
+            break
+        expected_len = unit_chars * rate
+        target = timeline.speech_at(unit_start) + expected_len
+        window = max(0.6, expected_len * 0.5)
+        sigma = max(0.25, expected_len * 0.2)
+        while j < len(pauses) and pauses[j][0] <= unit_start:
+            j += 1
+        best = None
+        i = j
+        while i < len(pauses):
+            pause_start, pause_end = pauses[i]
+            offset = timeline.speech_at(pause_start) - target
+            if offset > window:
+                break
+            if offset >= -window:
+                cost = (offset / sigma) ** 2 - PAUSE_WEIGHT * min(pause_end - pause_start, 1.0)
+                if best is None or cost < best[0]:
+                    best = (cost, pause_start, pause_end)
+            i += 1
+        if best:
+            spans.append((unit_start, best[1]))
+            unit_start = best[2]
+        else:
+            # Không có khoảng lặng phù hợp: cắt đúng tại vị trí dự đoán
+            expected = min(max(timeline.time_at(target), unit_start), end)
+            spans.append((unit_start, expected))
+            unit_start = expected
+    return spans
+
+
+def spread_words(words: list, start: float, end: float) -> list:
+    """Chia [start, end] cho các từ theo độ dài (trong một mệnh đề không còn khoảng lặng để neo)."""
+    weights = [len(word) + 1 for word in words]
+    scale = (end - start) / max(sum(weights), 1)
+    result = []
+    t = start
+    for word, weight in zip(words, weights):
+        result.append({"word": word, "start": t, "end": t + weight * scale})
+        t += weight * scale
+    return result
+
+
+def align_text_to_audio(
+    audio_file: str,
+    chapter_texts: list,
+    chapter_durations_ms: Optional[list] = None,
+    log_func: Optional[Callable[[str], None]] = None
+) -> list:
+    """
+    Forced alignment bằng năng lượng: tính timestamp cho text đã biết thay vì nhận dạng.
+
+    `chapter_texts` là nội dung từng chương theo thứ tự trong audio. Có
+    `chapter_durations_ms` (độ dài từng part, xem build state) thì mỗi chương được
+    căn trong đúng đoạn audio của nó; không có thì cả sách là một đoạn.
+    Câu được neo vào khoảng lặng, rồi mệnh đề trong câu, rồi từ chia theo độ dài.
+    Trả về list {"word", "start", "end"} như word timestamps của Whisper.
+    """
+    def log(msg: str):
+        if log_func:
+            log_func(msg)
+        else:
+            print(msg)
+
+    from subtitle_segmenter import CLAUSE_END, SENTENCE_END
+
+    timeline = SpeechTimeline(audio_energy_db(audio_file))
+    log(f"🔈 {timeline.duration:.0f}s audio, {len(timeline.pauses)} khoảng lặng")
+
+    if chapter_durations_ms and len(chapter_durations_ms) == len(chapter_texts):
+        bounds = []
+        offset = 0.0
+        for duration_ms in chapter_durations_ms:
+            bounds.append((offset, offset + duration_ms / 1000))
+            offset += duration_ms / 1000
+    else:
+        if chapter_durations_ms:
+            log("⚠️ Số chương không khớp với độ dài đã lưu, căn cả sách như một đoạn")
+        chapter_texts = [" ".join(chapter_texts)]
+        bounds = [(0.0, timeline.duration)]
+
+    words = []
+    for text, (chapter_start, chapter_end) in zip(chapter_texts, bounds):
+        chapter_start, chapter_end = timeline.trim(chapter_start, min(chapter_end, timeline.duration))
+        sentences = split_units(text.split(), SENTENCE_END)
+        for (start, end), sentence in zip(anchor_units(sentences, chapter_start, chapter_end, timeline), sentences):
+            clauses = split_units(sentence, CLAUSE_END)
+            for (clause_start, clause_end), clause in zip(anchor_units(clauses, start, end, timeline), clauses):
+                words.extend(spread_words(clause, clause_start, clause_end))
+    return words
+
+
+def generate_aligned_subtitle(
+    audio_file: str,
+    text_file: str,
+    chapter_durations_ms: Optional[list] = None,
+    log_func: Optional[Callable[[str], None]] = None,
+    formats: tuple = ("srt",)
+) -> str:
+    """
+    Tạo phụ đề từ text đã làm sạch (-cleaned.txt của convert_text_file_to_speech)
+    bằng forced alignment: không cần Whisper, nhanh hơn nhiều lần trên CPU và
+    phụ đề chứa đúng text của sách. Trả về đường dẫn file SRT (cùng tên với audio).
+    """
+    def log(msg: str):
+        if log_func:
+            log_func(msg)
+        else:
+            print(msg)
+
+    from text_cleaner import iter_chapters
+
+    if not os.path.exists(audio_file):
+        raise FileNotFoundError(f"Không tìm thấy file audio: {audio_file}")
+    srt_file = f"{os.path.splitext(audio_file)[0]}.srt"
+
+    # Chỉ tách chương, không làm sạch lại: clean_block không idempotent (vd. đoạn
+    # "Camera ..." không có dấu chấm trên dòng gốc sẽ ăn sang câu sau khi đã nối dòng)
+    with open(text_file, "r", encoding="utf-8") as f:
+        chapters = list(iter_chapters([f.read()]))
+    if not chapters:
+        raise ValueError(f"Không tìm thấy chương nào trong {text_file}")
+
+    log(f"🎯 Căn {len(chapters)} chương của {os.path.basename(text_file)} với audio...")
+    with span("align", chapters=len(chapters), audio_seconds=audio_seconds(audio_file)):
+        words = align_text_to_audio(audio_file, [content for _, content in chapters], chapter_durations_ms, log_func)
+    create_srt_from_words(words, srt_file, log_func=log_func, formats=formats)
+    return srt_file
+
+
+def transcribe_window(job: tuple) -> dict:
+    """Chạy trong process con: transcribe một đoạn audio (numpy) với model cache của process đó."""
+    model_name, audio, threads = job
+    import torch
+    torch.set_num_threads(threads)
+    model = load_whisper_model(model_name, log_func=lambda msg: None, device="cpu")
+    return model.transcribe(audio, language="vi", word_timestamps=True, verbose=None)
+
+
+def transcribe_audio_parallel(
+    audio_file: str,
+    model_name: str = "base",
+    workers: Optional[int] = None,
+    window_seconds: float = 300.0,
+    overlap_seconds: float = 2.0,
+    log_func: Optional[Callable[[str], None]] = None,
+    cut_points: Optional[list] = None
+) -> dict:
     """
-    Tạo file SRT từ kết quả transcription của Whisper
+    Transcribe song song trên nhiều core CPU
+
+    Audio được chia tại khoảng lặng thành các cửa sổ có phần chồng lấn, mỗi cửa sổ
+    chạy ở một process riêng. Segment của từng cửa sổ được dịch về thời gian toàn
+    cục và chỉ giữ segment có tâm nằm trong phần "của mình" để bỏ trùng ở vùng chồng lấn.
+    `cut_points` (giây, vd. từ silence map) thay cho việc dò khoảng lặng trên audio.
     """
+    def log(msg: str):
+        if log_func:
+            log_func(msg)
+        else:
+            print(msg)
     
+    import whisper
+
+    workers = workers or os.cpu_count() or 1
+    audio = whisper.load_audio(audio_file)
+    duration = len(audio) / WHISPER_SAMPLE_RATE
+    if cut_points is None:
+        cuts = find_silence_cut_points(audio, window_seconds)
+    else:
+        cuts = [cut for cut in cut_points if 0 < cut < duration]
+    bounds = list(zip([0.0] + cuts, cuts + [duration]))
+    log(f"✂️ Chia audio {duration:.0f}s thành {len(bounds)} đoạn, chạy {min(workers, len(bounds))} process")
+
+    jobs = []
+    offsets = []
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    for start, end in bounds:
+        window_start = max(0.0, start - overlap_seconds)
+        window_end = min(duration, end + overlap_seconds)
+        clip = audio[int(window_start * WHISPER_SAMPLE_RATE):int(window_end * WHISPER_SAMPLE_RATE)]
+        jobs.append((model_name, clip, threads))
+        offsets.append(window_start)
+
+    segments = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        for i, result in enumerate(pool.map(transcribe_window, jobs)):
+            start, end = bounds[i]
+            for segment in result.get("segments", []):
+                segment = dict(segment)
+                segment["start"] += offsets[i]
+                segment["end"] += offsets[i]
+                middle = (segment["start"] + segment["end"]) / 2
+                if not (start <= middle < end or (i == len(bounds) - 1 and middle >= start)):
+                    continue
+                if segment.get("words"):
+                    segment["words"] = [
+                        dict(word, start=word["start"] + offsets[i], end=word["end"] + offsets[i])
+                        for word in segment["words"]
+                    ]
+                segments.append(segment)
+            log(f"✅ Xong đoạn {i + 1}/{len(bounds)}")
+
+    for i, segment in enumerate(segments):
+        segment["id"] = i
+    log("✅ Transcription hoàn tất!")
+    return {
+        "text": "".join(segment["text"] for segment in segments),
+        "segments": segments,
+        "language": "vi",
+    }
+
+
+def parse_srt(srt_file: str) -> list:
+    """Đọc file SRT thành list dict {"start", "end", "text"} (giây); các dòng của một cue được nối bằng dấu cách."""
+    import re
+
+    with open(srt_file, "r", encoding="utf-8") as f:
+        blocks = f.read().strip().split("\n\n")
+    timestamp = r"(\d+):(\d{2}):(\d{2}),(\d{3})"
+    cues = []
+    for block in blocks:
+        lines = block.strip().splitlines()
+        for i, line in enumerate(lines):
+            m = re.match(timestamp + r"\s*-->\s*" + timestamp, line)
+            if m:
+                h1, m1, s1, ms1, h2, m2, s2, ms2 = (int(x) for x in m.groups())
+                cues.append({
+                    "start": h1 * 3600 + m1 * 60 + s1 + ms1 / 1000,
+                    "end": h2 * 3600 + m2 * 60 + s2 + ms2 / 1000,
+                    "text": " ".join(lines[i + 1:]).strip(),
+                })
+                break
+    return cues
+
+
+def splice_subtitle(
+    audio_file: str,
+    srt_file: str,
+    old_chapters: list,
+    new_chapters: list,
+    model_name: str = "base",
+    log_func: Optional[Callable[[str], None]] = None,
+    formats: tuple = ("srt",)
+) -> Optional[str]:
+    """
+    Cập nhật phụ đề khi chỉ một số chương thay đổi.
+
+    `old_chapters`/`new_chapters` là list {"key", "duration_ms"} theo thứ tự
+    trong audio gộp, ứng với SRT hiện có và audio mới. Cue của chương không
+    đổi (cùng key và độ dài) được giữ lại và dịch sang vị trí mới; chỉ đoạn
+    audio của chương thay đổi được transcribe lại.
+    Trả về None nếu không có gì để giữ lại (nên tạo lại toàn bộ).
+    """
     def log(msg: str):
         if log_func:
             log_func(msg)
         else:
             print(msg)
+
+    old_spans = {}
+    offset = 0.0
+    for chapter in old_chapters:
+        duration = chapter["duration_ms"] / 1000
+        old_spans.setdefault(chapter["key"], (offset, duration))
+        offset += duration
+
+    old_cues = parse_srt(srt_file)
+    segments = []
+    changed = []
+    offset = 0.0
+    for chapter in new_chapters:
+        duration = chapter["duration_ms"] / 1000
+        old = old_spans.get(chapter["key"])
+        if old and abs(old[1] - duration) < 0.05:
+            shift = offset - old[0]
+            for cue in old_cues:
+                middle = (cue["start"] + cue["end"]) / 2
+                if old[0] <= middle < old[0] + old[1]:
+                    segments.append(dict(cue, start=cue["start"] + shift, end=cue["end"] + shift))
+        else:
+            changed.append((offset, duration))
+        offset += duration
+
+    if len(changed) == len(new_chapters):
+        return None
+    log(f"✂️ Giữ phụ đề của {len(new_chapters) - len(changed)} chương, transcribe lại {len(changed)} chương")
+
+    if changed:
+        import whisper
+
+        with span("whisper.splice", model=model_name, audio_seconds=sum(duration for _, duration in changed)):
+            audio = whisper.load_audio(audio_file)
+            model = load_whisper_model(model_name, log_func)
+            for start, duration in changed:
+                clip = audio[int(start * WHISPER_SAMPLE_RATE):int((start + duration) * WHISPER_SAMPLE_RATE)]
+                result = model.transcribe(clip, language="vi", word_timestamps=True, verbose=None)
+                for segment in result.get("segments", []):
+                    segments.append({
+                        "start": segment["start"] + start,
+                        "end": min(segment["end"], duration) + start,
+                        "text": segment["text"],
+                        "words": [
+                            dict(word, start=word["start"] + start, end=min(word["end"], duration) + start)
+                            for word in segment.get("words") or []
+                        ],
+                    })
+
+    segments.sort(key=lambda segment: segment["start"])
+    create_srt_file({"segments": segments}, srt_file, log_func, formats)
+    return srt_file
+
+
+def create_srt_file(
+    result: dict,
+    output_file: str,
+    log_func: Optional[Callable[[str], None]] = None,
+    formats: tuple = ("srt",)
+):
+    """
+    Tạo file SRT (và VTT/ASS nếu có trong `formats`) từ kết quả transcription
+    của Whisper. Cue được chia lại theo timestamp từng từ (xem subtitle_segmenter).
+    """
     
-    def format_timestamp(seconds: float) -> str:
-        """Chuyển đổi seconds thành định dạng SRT (HH:MM:SS,mmm)"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        milliseconds = int((seconds % 1) * 1000)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
+    def log(msg: str):
+        if log_func:
+            log_func(msg)
+        else:
+            print(msg)
     
     log("📝 Đang tạo file SRT...")
     
-    with open(output_file, "w", encoding="utf-8") as f:
-        if "segments" in result:
-            # Xử lý từng segment
-            for i, segment in enumerate(result["segments"], 1):
-                start_time = format_timestamp(segment["start"])
-                end_time = format_timestamp(segment["end"])
-                text = segment["text"].strip()
-                
-                # Chia text dài thành nhiều dòng
-                lines = split_text_into_lines(text, max_chars=50)
-                
-                f.write(f"{i}\n")
-                f.write(f"{start_time} --> {end_time}\n")
-                f.write(f"{lines}\n\n")
+    if "segments" in result:
+        cues = cues_from_result(result)
+    else:
+        # Fallback: tạo một segment duy nhất cho toàn bộ text
+        text = result.get("text", "").strip()
+        cues = []
+        if text:
+            # Ước tính thời gian dựa trên độ dài text
+            words = text.split()
+            duration = max(len(words) / 2.5, 5)  # Khoảng 2.5 từ/giây
+            cues.append({"start": 0.0, "end": duration, "text": text,
+                         "lines": split_text_into_lines(text, max_chars=50).split("\n")})
+    
+    for path in write_subtitles(cues, output_file, formats):
+        log(f"✅ Đã lưu file phụ đề: {path}")
+    fast = count_fast_cues(cues)
+    if fast:
+        log(f"ℹ️ {fast}/{len(cues)} dòng phụ đề nhanh hơn tốc độ đọc khuyến nghị")
+
+
+def create_srt_from_words(
+    words: list,
+    output_file: str,
+    max_line_chars: int = MAX_LINE_CHARS,
+    max_duration: float = MAX_CUE_SECONDS,
+    log_func: Optional[Callable[[str], None]] = None,
+    formats: tuple = ("srt",)
+):
+    """
+    Tạo file SRT trực tiếp từ danh sách từ có timestamp (không cần Whisper)
+    
+    Args:
+        words: List dict {"word", "start", "end"} (giây), cùng dạng với word timestamps của Whisper
+        output_file: Đường dẫn file SRT
+        max_line_chars: Số ký tự tối đa mỗi dòng (mỗi cue tối đa 2 dòng)
+        max_duration: Thời lượng tối đa mỗi cue (giây)
+        log_func: Hàm callback để log thông tin
+        formats: Các định dạng ghi ra cạnh file SRT ("srt", "vtt", "ass")
+    """
+    
+    def log(msg: str):
+        if log_func:
+            log_func(msg)
         else:
-            # Fallback: tạo một segment duy nhất cho toàn bộ text
-            text = result.get("text", "").strip()
-            if text:
-                # Ước tính thời gian dựa trên độ dài text
-                words = text.split()
-                duration = max(len(words) / 2.5, 5)  # Khoảng 2.5 từ/giây
-                
-                lines = split_text_into_lines(text, max_chars=50)
-                
-                f.write("1\n")
-                f.write(f"00:00:00,000 --> {format_timestamp(duration)}\n")
-                f.write(f"{lines}\n\n")
-    
-    log(f"✅ Đã lưu file SRT: {output_file}")
+            print(msg)
+    
+    log("📝 Đang tạo file SRT từ timestamp từng từ...")
+    
+    cues = cues_from_words(words, max_line_chars=max_line_chars, max_duration=max_duration)
+    for path in write_subtitles(cues, output_file, formats):
+        log(f"✅ Đã lưu file phụ đề: {path} ({len(cues)} dòng phụ đề)")
 
 
 def split_text_into_lines(text: str, max_chars: int = 50) -> str:
@@ -187,46 +734,13 @@ def split_text_into_lines(text: str, max_chars: int = 50) -> str:
 
 def create_optimized_segments(result: dict, max_segment_length: int = 10) -> dict:
     """
-    Tối ưu hóa segments để có độ dài phù hợp cho subtitle
+    Tối ưu hóa segments để có độ dài phù hợp cho subtitle: chia lại theo
+    timestamp thật của từng từ, mỗi segment dài tối đa `max_segment_length` giây
     """
     if "segments" not in result:
         return result
     
-    optimized_segments = []
-    
-    for segment in result["segments"]:
-        duration = segment["end"] - segment["start"]
-        text = segment["text"].strip()
-        
-        if duration <= max_segment_length:
-            optimized_segments.append(segment)
-        else:
-            # Chia segment dài thành các phần nhỏ hơn
-            words = text.split()
-            if len(words) <= 1:
-                optimized_segments.append(segment)
-                continue
-                
-            # Chia đều thời gian cho các từ
-            time_per_word = duration / len(words)
-            
-            # Nhóm từ thành các segment ngắn hơn
-            words_per_segment = max(1, int(max_segment_length / time_per_word))
-            
-            for i in range(0, len(words), words_per_segment):
-                word_group = words[i:i + words_per_segment]
-                segment_text = " ".join(word_group)
-                
-                start_time = segment["start"] + i * time_per_word
-                end_time = min(segment["start"] + (i + len(word_group)) * time_per_word, segment["end"])
-                
-                optimized_segments.append({
-                    "start": start_time,
-                    "end": end_time,
-                    "text": segment_text
-                })
-    
-    result["segments"] = optimized_segments
+    result["segments"] = cues_from_result(result, max_duration=max_segment_length)
     return result
 
 
@@ -291,6 +805,13 @@ def test_subtitle_generation():
 
 
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 4 and sys.argv[1] == "align":
+        # python subtitle_generator.py align book-final.mp3 book-cleaned.txt [vtt ass]
+        generate_aligned_subtitle(sys.argv[2], sys.argv[3], formats=("srt", *sys.argv[4:]))
+        sys.exit(0)
+
     print("Whisper Local Subtitle Generator")
     print("=" * 40)
     
@@ -0,0 +1,279 @@
+"""
+Chia phụ đề theo timestamp từng từ (Whisper word_timestamps hoặc word boundary
+của TTS) thay vì lấy nguyên segment hay chia đều thời gian.
+
+Một lượt qua danh sách từ, mỗi cue thỏa:
+    - tối đa `max_lines` dòng, mỗi dòng tối đa `max_line_chars` ký tự (2 dòng được chia cân nhau)
+    - dài tối đa `max_duration` giây
+    - tách ở khoảng nghỉ >= `pause` giây, ở cuối câu, và ở dấu phẩy khi cue đã đầy quá nửa
+    - thời gian hiển thị được kéo dài vào khoảng lặng phía sau để đủ `min_duration`
+      và tốc độ đọc `max_cps` ký tự/giây, nhưng luôn cách cue sau ít nhất `min_gap` giây
+
+Ghi ra SRT, WebVTT và ASS. Chuyển file SRT có sẵn sang định dạng khác:
+    python subtitle_segmenter.py book-final.srt vtt ass
+"""
+import math
+import os
+
+MAX_LINE_CHARS = 42
+MAX_LINES = 2
+MAX_CUE_SECONDS = 6.0
+MIN_CUE_SECONDS = 1.0
+MIN_GAP_SECONDS = 0.08
+MAX_CPS = 17.0
+PAUSE_SECONDS = 0.6
+
+SENTENCE_END = ".!?…"
+CLAUSE_END = ",;:"
+
+
+def wrap_lines(words: list, max_line_chars: int = MAX_LINE_CHARS, max_lines: int = MAX_LINES) -> list:
+    """
+    Chia các từ của một cue thành dòng, xếp lần lượt từng dòng tối đa
+    `max_line_chars`. Nếu vừa 2 dòng thì cắt tại điểm làm dòng dài hơn ngắn
+    nhất để hai dòng cân nhau.
+    """
+    if max_lines < 2:
+        return [" ".join(words)]
+
+    lines = []
+    current = []
+    length = 0
+    for word in words:
+        if current and length + 1 + len(word) > max_line_chars:
+            lines.append(" ".join(current))
+            current, length = [], 0
+        length += len(word) + (1 if current else 0)
+        current.append(word)
+    lines.append(" ".join(current))
+    if len(lines) != 2:
+        return lines
+
+    total = len(lines[0]) + 1 + len(lines[1])
+    best_width, best_index = total, 1
+    left = -1
+    for i in range(1, len(words)):
+        left += len(words[i - 1]) + 1
+        width = max(left, total - left - 1)
+        if width < best_width:
+            best_width, best_index = width, i
+    return [" ".join(words[:best_index]), " ".join(words[best_index:])]
+
+
+def cues_from_words(
+    words: list,
+    max_line_chars: int = MAX_LINE_CHARS,
+    max_lines: int = MAX_LINES,
+    max_duration: float = MAX_CUE_SECONDS,
+    min_duration: float = MIN_CUE_SECONDS,
+    min_gap: float = MIN_GAP_SECONDS,
+    max_cps: float = MAX_CPS,
+    pause: float = PAUSE_SECONDS
+) -> list:
+    """
+    `words`: list dict {"word", "start", "end"} (giây) theo thứ tự thời gian.
+    Trả về list cue {"start", "end", "text", "lines"}.
+    """
+    max_chars = max_line_chars * max_lines
+    cues = []
+    current = []    # các từ của cue đang dựng
+    chars = 0
+    # Xếp dòng tham lam song song với việc thêm từ: còn vừa max_lines dòng thì
+    # cách chia cân nhau của wrap_lines cũng vừa
+    line_count = line_chars = 0
+    cue_start = cue_end = 0.0
+
+    def close_cue():
+        text_words = [w for w, _, _ in current]
+        cue = {"start": cue_start, "end": cue_end, "text": " ".join(text_words),
+               "lines": wrap_lines(text_words, max_line_chars, max_lines)}
+        if cues:
+            settle(cues[-1], cue["start"])
+        cues.append(cue)
+
+    def settle(cue, next_start):
+        # Kéo dài vào khoảng lặng để đủ thời gian đọc, nhưng chừa min_gap trước cue sau
+        wanted = cue["start"] + max(min_duration, len(cue["text"]) / max_cps)
+        limit = next_start - min_gap
+        end = max(cue["end"], min(wanted, limit))
+        if end > limit:
+            end = max(limit, cue["start"] + 0.01)
+        cue["end"] = end
+
+    for word in words:
+        text = str(word["word"]).strip()
+        if not text:
+            continue
+        start = float(word["start"])
+        end = max(float(word["end"]), start)
+
+        if current:
+            wraps = line_chars + 1 + len(text) > max_line_chars
+            too_long = wraps and (line_count >= max_lines or len(text) > max_line_chars)
+            too_slow = end - cue_start > max_duration
+            paused = start - cue_end >= pause
+            if too_long or too_slow or paused:
+                close_cue()
+                current = []
+
+        if not current:
+            cue_start, chars = start, len(text)
+            line_count, line_chars = 1, len(text)
+        else:
+            chars += 1 + len(text)
+            if line_chars + 1 + len(text) > max_line_chars:
+                line_count, line_chars = line_count + 1, len(text)
+            else:
+                line_chars += 1 + len(text)
+        current.append((text, start, end))
+        cue_end = end
+
+        # Ngắt tự nhiên: hết câu, hoặc dấu phẩy khi cue đã quá nửa
+        if text[-1] in SENTENCE_END or (text[-1] in CLAUSE_END and chars > max_chars / 2):
+            close_cue()
+            current = []
+
+    if current:
+        close_cue()
+    if cues:
+        settle(cues[-1], math.inf)
+    return cues
+
+
+def cues_from_result(result: dict, **limits) -> list:
+    """
+    Dựng cue từ kết quả Whisper: từ của các segment liên tiếp được chia lại bằng
+    cues_from_words; segment không có word timestamp (vd. cue giữ lại từ SRT cũ)
+    được giữ nguyên làm một cue.
+    """
+    max_line_chars = limits.get("max_line_chars", MAX_LINE_CHARS)
+    max_lines = limits.get("max_lines", MAX_LINES)
+    cues = []
+    pending = []
+    for segment in result.get("segments", []):
+        if segment.get("words"):
+            pending.extend(segment["words"])
+            continue
+        cues.extend(cues_from_words(pending, **limits))
+        pending = []
+        text = segment["text"].strip()
+        if text:
+            cues.append({"start": segment["start"], "end": segment["end"], "text": text,
+                         "lines": wrap_lines(text.split(), max_line_chars, max_lines)})
+    cues.extend(cues_from_words(pending, **limits))
+    return cues
+
+
+def count_fast_cues(cues: list, max_cps: float = MAX_CPS) -> int:
+    """Số cue vẫn vượt tốc độ đọc (giọng đọc nhanh hơn tốc độ đọc, không có khoảng lặng để kéo dài)."""
+    return sum(1 for cue in cues if len(cue["text"]) > max_cps * max(cue["end"] - cue["start"], 0.001))
+
+
+def format_srt_timestamp(seconds: float) -> str:
+    """Chuyển đổi seconds thành định dạng SRT (HH:MM:SS,mmm)"""
+    total_ms = int(round(seconds * 1000))
+    hours, rest = divmod(total_ms, 3600000)
+    minutes, rest = divmod(rest, 60000)
+    secs, milliseconds = divmod(rest, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
+
+
+def format_vtt_timestamp(seconds: float) -> str:
+    return format_srt_timestamp(seconds).replace(",", ".")
+
+
+def format_ass_timestamp(seconds: float) -> str:
+    """ASS dùng H:MM:SS.cc (phần trăm giây)."""
+    total_cs = int(round(seconds * 100))
+    hours, rest = divmod(total_cs, 360000)
+    minutes, rest = divmod(rest, 6000)
+    secs, centiseconds = divmod(rest, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def cue_lines(cue: dict) -> list:
+    return cue.get("lines") or cue["text"].splitlines()
+
+
+def write_srt(cues: list, output_file: str):
+    with open(output_file, "w", encoding="utf-8") as f:
+        for i, cue in enumerate(cues, 1):
+            f.write(f"{i}\n")
+            f.write(f"{format_srt_timestamp(cue['start'])} --> {format_srt_timestamp(cue['end'])}\n")
+            f.write("\n".join(cue_lines(cue)) + "\n\n")
+
+
+def write_vtt(cues: list, output_file: str):
+    def escape(line):
+        return line.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        for cue in cues:
+            f.write(f"{format_vtt_timestamp(cue['start'])} --> {format_vtt_timestamp(cue['end'])}\n")
+            f.write("\n".join(escape(line) for line in cue_lines(cue)) + "\n\n")
+
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1920
+PlayResY: 1080
+WrapStyle: 2
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,{font},{font_size},&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,3,1,2,60,60,60,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def write_ass(cues: list, output_file: str, font: str = "Arial", font_size: int = 64):
+    def escape(line):
+        # "{...}" là lệnh override của ASS
+        return line.replace("{", "(").replace("}", ")")
+
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(ASS_HEADER.format(font=font, font_size=font_size))
+        for cue in cues:
+            text = r"\N".join(escape(line) for line in cue_lines(cue))
+            f.write(f"Dialogue: 0,{format_ass_timestamp(cue['start'])},{format_ass_timestamp(cue['end'])},"
+                    f"Default,,0,0,0,,{text}\n")
+
+
+SUBTITLE_WRITERS = {
+    "srt": write_srt,
+    "vtt": write_vtt,
+    "ass": write_ass,
+}
+
+
+def subtitle_paths(srt_file: str, formats=("srt",)) -> list:
+    """Các file phụ đề cùng tên với `srt_file`, mỗi định dạng một đuôi."""
+    base = os.path.splitext(srt_file)[0]
+    return [f"{base}.{fmt}" for fmt in formats]
+
+
+def write_subtitles(cues: list, srt_file: str, formats=("srt",)) -> list:
+    """Ghi `cues` ra từng định dạng trong `formats`; trả về danh sách file đã ghi."""
+    unknown = [fmt for fmt in formats if fmt not in SUBTITLE_WRITERS]
+    if unknown:
+        raise ValueError(f"Không hỗ trợ định dạng phụ đề: {', '.join(unknown)} (có: {', '.join(SUBTITLE_WRITERS)})")
+    paths = subtitle_paths(srt_file, formats)
+    for fmt, path in zip(formats, paths):
+        SUBTITLE_WRITERS[fmt](cues, path)
+    return paths
+
+
+if __name__ == "__main__":
+    import sys
+    from subtitle_generator import parse_srt
+
+    if len(sys.argv) < 3:
+        print("Cách dùng: python subtitle_segmenter.py file.srt vtt [ass ...]")
+        raise SystemExit(1)
+    cues = [dict(cue, lines=wrap_lines(cue["text"].split())) for cue in parse_srt(sys.argv[1])]
+    for path in write_subtitles(cues, sys.argv[1], sys.argv[2:]):
+        print(f"✅ {path}")
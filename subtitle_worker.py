@@ -0,0 +1,182 @@
+"""
+Worker tạo phụ đề chạy lâu dài: giữ Whisper model trong bộ nhớ và nhận job qua socket local.
+
+Chạy server:
+    python subtitle_worker.py --model base --port 50713
+
+Gửi job từ process khác:
+    generate_subtitle_remote("book-final.mp3", "base")
+
+multiprocessing.connection unpickle mọi message nhận được, nên authkey phải bí
+mật: mỗi lần khởi động worker sinh một key ngẫu nhiên, ghi vào KEY_FILE (chỉ
+user hiện tại đọc được, quyền 0600). Client đọc key từ biến môi trường
+TTS_SUBTITLE_WORKER_KEY (hex) nếu có, không thì từ KEY_FILE.
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import secrets
+from multiprocessing.connection import Client, Listener
+from typing import Callable, Optional
+
+DEFAULT_ADDRESS = ("127.0.0.1", 50713)
+KEY_ENV = "TTS_SUBTITLE_WORKER_KEY"
+KEY_FILE = os.path.join(os.path.expanduser("~"), ".tts-subtitle-worker.key")
+
+
+def write_worker_key(key_file: str = KEY_FILE) -> bytes:
+    """Sinh authkey ngẫu nhiên cho worker và ghi (hex) vào `key_file` với quyền 0600."""
+    key = secrets.token_bytes(32)
+    if os.path.lexists(key_file):
+        os.remove(key_file)
+    # O_EXCL: không ghi xuyên qua symlink/file của người khác tạo sẵn
+    fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(key.hex())
+    return key
+
+
+def read_worker_key(key_file: str = KEY_FILE) -> bytes:
+    """Authkey của worker đang chạy: biến môi trường KEY_ENV, không có thì đọc `key_file`."""
+    value = os.environ.get(KEY_ENV)
+    if not value:
+        try:
+            with open(key_file, "r", encoding="utf-8") as f:
+                value = f.read()
+        except FileNotFoundError:
+            raise RuntimeError(f"Không tìm thấy key của subtitle worker ({key_file}), worker chưa chạy?")
+    try:
+        return bytes.fromhex(value.strip())
+    except ValueError:
+        raise RuntimeError(f"Key của subtitle worker không hợp lệ (cần chuỗi hex trong {KEY_ENV} hoặc {key_file})")
+
+
+def serve_subtitle_worker(
+    address: tuple = DEFAULT_ADDRESS,
+    authkey: Optional[bytes] = None,
+    preload_model: Optional[str] = "base",
+    log_func: Callable[[str], None] = print,
+    key_file: str = KEY_FILE
+):
+    """
+    Nhận job {"audio_file", "model_name"} tuần tự và trả về đường dẫn SRT.
+    Các dòng log được gửi ngược về client dưới dạng ("log", msg).
+    Không truyền `authkey` thì sinh key mới và ghi vào `key_file`.
+    """
+    from subtitle_generator import generate_subtitle, load_whisper_model
+
+    if authkey is None:
+        authkey = write_worker_key(key_file)
+    if preload_model:
+        load_whisper_model(preload_model, log_func)
+
+    with Listener(address, authkey=authkey) as listener:
+        log_func(f"🟢 Subtitle worker đang chờ job tại {address[0]}:{address[1]}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (multiprocessing.AuthenticationError, OSError, EOFError) as e:
+                # Kết nối lạ hoặc sai authkey không được làm chết worker
+                log_func(f"⚠️ Bỏ qua kết nối không hợp lệ: {e}")
+                continue
+            with conn:
+                try:
+                    job = conn.recv()
+                except (EOFError, OSError, pickle.UnpicklingError) as e:
+                    # Client ngắt giữa message hoặc gửi dữ liệu không unpickle được
+                    log_func(f"⚠️ Bỏ qua job không đọc được: {e}")
+                    continue
+                if not isinstance(job, dict):
+                    log_func(f"⚠️ Bỏ qua job không hợp lệ: {type(job).__name__}")
+                    continue
+                if job.get("command") == "ping":
+                    conn.send(("done", None))
+                    continue
+                if job.get("command") == "shutdown":
+                    conn.send(("done", None))
+                    log_func("🛑 Dừng subtitle worker")
+                    return
+
+                def send_log(msg: str):
+                    log_func(msg)
+                    conn.send(("log", msg))
+
+                try:
+                    srt_file = generate_subtitle(job["audio_file"], job.get("model_name", "base"), send_log,
+                                                 formats=job.get("formats", ("srt",)))
+                    conn.send(("done", srt_file))
+                except (EOFError, OSError) as e:
+                    # Client đã ngắt kết nối giữa chừng, bỏ qua và chờ job tiếp theo
+                    log_func(f"⚠️ Mất kết nối với client: {e}")
+                except Exception as e:
+                    conn.send(("error", str(e)))
+
+
+def generate_subtitle_remote(
+    audio_file: str,
+    model_name: str = "base",
+    log_func: Optional[Callable[[str], None]] = None,
+    address: tuple = DEFAULT_ADDRESS,
+    authkey: Optional[bytes] = None,
+    formats: tuple = ("srt",)
+) -> str:
+    """Gửi job tới worker đang chạy; cùng kết quả với subtitle_generator.generate_subtitle."""
+    log = log_func or print
+    authkey = authkey or read_worker_key()
+    with Client(address, authkey=authkey) as conn:
+        conn.send({"audio_file": audio_file, "model_name": model_name, "formats": tuple(formats)})
+        while True:
+            kind, payload = conn.recv()
+            if kind == "log":
+                log(payload)
+            elif kind == "done":
+                return payload
+            else:
+                raise RuntimeError(payload)
+
+
+def start_subtitle_worker(
+    address: tuple = DEFAULT_ADDRESS,
+    authkey: Optional[bytes] = None,
+    preload_model: Optional[str] = "base"
+) -> multiprocessing.Process:
+    """
+    Chạy worker ở process nền (daemon), trả về Process để có thể dừng sau.
+    Không truyền `authkey` thì sinh key mới vào KEY_FILE trước khi start, để
+    client gọi ngay sau đó đã đọc được.
+    """
+    authkey = authkey or write_worker_key()
+    process = multiprocessing.Process(
+        target=serve_subtitle_worker,
+        args=(address, authkey, preload_model),
+        daemon=True
+    )
+    process.start()
+    return process
+
+
+def stop_subtitle_worker(address: tuple = DEFAULT_ADDRESS, authkey: Optional[bytes] = None):
+    with Client(address, authkey=authkey or read_worker_key()) as conn:
+        conn.send({"command": "shutdown"})
+        conn.recv()
+
+
+def is_worker_running(address: tuple = DEFAULT_ADDRESS, authkey: Optional[bytes] = None) -> bool:
+    try:
+        with Client(address, authkey=authkey or read_worker_key()) as conn:
+            conn.send({"command": "ping"})
+            conn.recv()
+        return True
+    except (OSError, EOFError, RuntimeError, multiprocessing.AuthenticationError):
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Whisper subtitle worker")
+    parser.add_argument("--host", default=DEFAULT_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument("--model", default="base", help="Model tải sẵn khi khởi động")
+    parser.add_argument("--key-file", default=KEY_FILE, help="File ghi authkey cho client (quyền 0600)")
+    args = parser.parse_args()
+    serve_subtitle_worker((args.host, args.port), preload_model=args.model, key_file=args.key_file)
@@ -0,0 +1,80 @@
+"""
+Bản regex nhiều lượt ban đầu của clean_for_tts / split_text_by_chapters, giữ
+lại làm chuẩn so sánh cho text_cleaner (bản streaming phải cho kết quả giống
+hệt từng byte).
+
+So sánh tốc độ trên một file sách thật:
+    python -m tests.reference_cleaner book.txt [số lần chạy]
+"""
+import re
+import sys
+import time
+import unicodedata
+
+from text_cleaner import clean_file, iter_clean_blocks
+
+
+def reference_clean_for_tts(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text)
+    text = re.sub(r"\*\*.*?\*\*", "", text)
+    text = re.sub(r"\*.*?\*", "", text)
+    text = re.sub(r"[\(\)\[\]\{\}<>\"""''']", "", text)
+    text = re.sub(r"Camera.*?\.", "", text)
+    text = re.sub(r"(?m)^---.*?---", "", text)
+    text = re.sub(r"[^a-zA-ZÀ-ỹ0-9\s\.,!?:;\-…#]", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def reference_split_text_by_chapters(text: str) -> list:
+    pattern = r"#\s*(.*?)\s*#"
+    matches = list(re.finditer(pattern, text))
+    parts = []
+
+    for i, match in enumerate(matches):
+        title = match.group(1).strip()
+        start = match.end()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        content = text[start:end].strip()
+        if content:
+            parts.append((title, content))
+    return parts
+
+
+def benchmark_cleaner(input_file: str, repeat: int = 3, log_func=print) -> dict:
+    """
+    So sánh bản streaming với bản regex cũ trên một file thật: kiểm tra kết quả
+    giống hệt từng byte rồi đo thời gian tốt nhất trong `repeat` lần chạy.
+    """
+    with open(input_file, "r", encoding="utf-8") as f:
+        text = f.read()
+
+    expected_text = reference_clean_for_tts(text)
+    expected_chapters = reference_split_text_by_chapters(expected_text)
+    cleaned_text = " ".join(iter_clean_blocks([text]))
+    chapters, _ = clean_file(input_file)
+    if cleaned_text != expected_text or chapters != expected_chapters:
+        raise AssertionError(f"Kết quả làm sạch khác bản gốc: {input_file}")
+
+    def best_of(func):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    reference = best_of(lambda: reference_split_text_by_chapters(reference_clean_for_tts(text)))
+    streaming = best_of(lambda: clean_file(input_file))
+    mb = len(text.encode("utf-8")) / 1024 ** 2
+    log_func(f"📏 {input_file}: {mb:.1f} MB, {len(chapters)} chương, kết quả giống hệt bản gốc")
+    log_func(f"🐢 Regex nhiều lượt: {reference:.3f}s ({mb / reference:.1f} MB/s)")
+    log_func(f"⚡ Streaming 1 lượt: {streaming:.3f}s ({mb / streaming:.1f} MB/s)")
+    return {"reference": reference, "streaming": streaming, "chapters": len(chapters)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Cách dùng: python -m tests.reference_cleaner book.txt [số lần chạy]")
+        raise SystemExit(1)
+    benchmark_cleaner(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 3)
@@ -0,0 +1,49 @@
+"""Phụ đề căn text (generate_aligned_subtitle) phải giữ đúng từng từ của -cleaned.txt."""
+import asyncio
+import os
+import shutil
+
+import pytest
+
+from media_probe import find_tool
+from text_cleaner import clean_file
+
+pytest.importorskip("numpy")
+if not shutil.which(find_tool("ffmpeg")):
+    pytest.skip("cần ffmpeg", allow_module_level=True)
+
+from mp3_frames import concat_mp3_files, read_mp3_info  # noqa: E402
+from subtitle_generator import generate_aligned_subtitle, parse_srt  # noqa: E402
+from tts_backends import ToneBackend  # noqa: E402
+
+# "Camera ..." không có dấu chấm trên dòng gốc: làm sạch lần hai sẽ xóa tới dấu chấm của câu sau
+BOOK = (
+    "#Chương 1#\n"
+    "Camera quay toàn cảnh\n"
+    "Anh ấy bước vào phòng. Căn phòng tối, chỉ có một ngọn đèn.\n"
+    "#Chương 2#\n"
+    "Sáng hôm sau, trời đổ mưa. Cô ấy mở cửa sổ!\n"
+)
+
+
+def test_aligned_cues_keep_cleaned_text(tmp_path):
+    input_file = tmp_path / "book.txt"
+    input_file.write_text(BOOK, encoding="utf-8")
+    cleaned_file = str(tmp_path / "book-cleaned.txt")
+    chapters, _ = clean_file(str(input_file), cleaned_file)
+    assert "Anh ấy bước vào phòng." in chapters[0][1]
+
+    backend = ToneBackend()
+    parts = []
+    for i, (_, content) in enumerate(chapters, 1):
+        part = str(tmp_path / f"book-part-{i:03d}.mp3")
+        asyncio.run(backend.synthesize(content, part, "vi", "0%"))
+        parts.append(part)
+    audio_file = str(tmp_path / "book-final.mp3")
+    infos = [read_mp3_info(part) for part in parts]
+    assert concat_mp3_files(parts, audio_file, infos)
+
+    srt_file = generate_aligned_subtitle(audio_file, cleaned_file, [info["duration_ms"] for info in infos],
+                                         log_func=lambda msg: None)
+    cue_words = " ".join(cue["text"] for cue in parse_srt(srt_file)).split()
+    assert cue_words == " ".join(content for _, content in chapters).split()
@@ -0,0 +1,88 @@
+"""
+Worker pool của synthesize_chapters chạy với edge_tts giả (không cần mạng):
+file -part-NNN.mp3 đúng thứ tự chương, số request song song và tốc độ gửi
+request bị giới hạn theo concurrency / token bucket.
+"""
+import asyncio
+import sys
+import time
+import types
+
+import pytest
+
+from convert import synthesize_chapters
+from mp3_frames import read_mp3_info
+
+# Frame MP3 hợp lệ: MPEG-2 layer 3, 48 kbps, 24 kHz mono (144 byte)
+FRAME = bytes([0xFF, 0xF3, 0x64, 0xC4]) + b"\0" * 140
+FRAMES_PER_CHAPTER = 5
+
+
+class FakeEdgeTTS:
+    """Module edge_tts giả: chương 1 chậm nhất nên các worker xong ngược thứ tự."""
+
+    def __init__(self, chapters: int):
+        self.chapters = chapters
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.starts = []
+        fake = self
+
+        class Communicate:
+            def __init__(self, text, voice, rate="+0%", **kwargs):
+                self.number = int(text.split()[-1])
+
+            async def save(self, output_path):
+                fake.starts.append(time.monotonic())
+                fake.in_flight += 1
+                fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    await asyncio.sleep(0.01 * (fake.chapters - self.number + 1))
+                    with open(output_path, "wb") as f:
+                        f.write(FRAME * FRAMES_PER_CHAPTER * self.number)
+                finally:
+                    fake.in_flight -= 1
+
+        self.module = types.ModuleType("edge_tts")
+        self.module.Communicate = Communicate
+
+
+@pytest.fixture
+def fake_edge(monkeypatch):
+    def install(chapters: int) -> FakeEdgeTTS:
+        fake = FakeEdgeTTS(chapters)
+        monkeypatch.setitem(sys.modules, "edge_tts", fake.module)
+        return fake
+    return install
+
+
+def run_pool(tmp_path, chapters: int, **kwargs) -> list:
+    jobs = [(f"Chương {i}", f"Nội dung chương {i}", str(tmp_path / f"book-part-{i:03d}.mp3"))
+            for i in range(1, chapters + 1)]
+    results = asyncio.run(synthesize_chapters(jobs, log_func=lambda msg: None, backend="edge", **kwargs))
+    assert all(results)
+    return jobs
+
+
+def test_parts_written_in_chapter_order(tmp_path, fake_edge):
+    fake = fake_edge(6)
+    jobs = run_pool(tmp_path, 6, concurrency=3, requests_per_second=None)
+    for i, (_, _, output_path) in enumerate(jobs, 1):
+        assert read_mp3_info(output_path)["frames"] == FRAMES_PER_CHAPTER * i
+    assert fake.max_in_flight > 1
+
+
+def test_concurrency_limits_in_flight_requests(tmp_path, fake_edge):
+    fake = fake_edge(8)
+    run_pool(tmp_path, 8, concurrency=2, requests_per_second=None)
+    assert fake.max_in_flight == 2
+
+
+def test_token_bucket_limits_request_rate(tmp_path, fake_edge):
+    fake = fake_edge(10)
+    rate, concurrency = 20.0, 4
+    run_pool(tmp_path, 10, concurrency=concurrency, requests_per_second=rate)
+    starts = sorted(fake.starts)
+    # Burst tối đa `concurrency` request, sau đó không nhanh hơn `rate` request/giây
+    for k in range(concurrency, len(starts)):
+        assert starts[k] - starts[0] >= (k - concurrency + 1) / rate - 0.01
@@ -0,0 +1,43 @@
+"""Golden test cho text_cleaner: fixture nhỏ phủ các luật làm sạch và tách chương."""
+import io
+import json
+import os
+
+from reference_cleaner import reference_clean_for_tts, reference_split_text_by_chapters
+from text_cleaner import clean_file, iter_chapters, iter_clean_blocks, iter_text_blocks
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+INPUT_FILE = os.path.join(FIXTURES, "cleaner_input.txt")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def expected_chapters() -> list:
+    return [tuple(chapter) for chapter in json.loads(read_fixture("cleaner_expected_chapters.json"))]
+
+
+def test_clean_file_matches_golden(tmp_path):
+    cleaned_file = tmp_path / "cleaned.txt"
+    chapters, length = clean_file(INPUT_FILE, str(cleaned_file))
+    expected = read_fixture("cleaner_expected.txt")
+    assert cleaned_file.read_text(encoding="utf-8") == expected
+    assert length == len(expected)
+    assert chapters == expected_chapters()
+
+
+def test_small_blocks_match_golden():
+    # Khối nhỏ để ranh giới khối rơi vào giữa các luật (khối "**" qua dòng, "---", "#" chưa đóng)
+    for block_chars in (1, 7, 64):
+        blocks = iter_text_blocks(io.StringIO(read_fixture("cleaner_input.txt")), block_chars)
+        pieces = list(iter_clean_blocks(blocks))
+        assert " ".join(pieces) == read_fixture("cleaner_expected.txt")
+        assert list(iter_chapters(pieces)) == expected_chapters()
+
+
+def test_golden_matches_reference():
+    text = reference_clean_for_tts(read_fixture("cleaner_input.txt"))
+    assert text == read_fixture("cleaner_expected.txt")
+    assert reference_split_text_by_chapters(text) == expected_chapters()
@@ -0,0 +1,144 @@
+"""
+Làm sạch text cho TTS và tách chương theo kiểu streaming, một lượt qua file.
+
+Cho kết quả giống hệt từng byte với bản regex cũ (tests/reference_cleaner.py)
+nhưng:
+    - đọc file theo khối dòng, không giữ toàn bộ sách và các bản sao trung gian
+    - regex được compile sẵn; không pattern nào khớp qua "\\n" nên áp dụng theo
+      khối vẫn đúng, và khối nào không có ký tự kích hoạt thì bỏ qua bước đó
+    - gộp khoảng trắng bằng str.split() thay cho re.sub(r"\\s+")
+    - tách chương ngay trên luồng text đã làm sạch
+
+Kiểm tra bằng fixture trong tests/ (python -m pytest tests), so sánh tốc độ
+với bản cũ trên sách thật:
+    python -m tests.reference_cleaner book.txt
+"""
+import re
+import unicodedata
+
+BLOCK_CHARS = 1024 * 1024
+
+BOLD_RE = re.compile(r"\*\*.*?\*\*")
+ITALIC_RE = re.compile(r"\*.*?\*")
+BRACKETS_RE = re.compile(r"[\(\)\[\]\{\}<>\"']")
+CAMERA_RE = re.compile(r"Camera.*?\.")
+SEPARATOR_RE = re.compile(r"(?m)^---.*?---")
+DISALLOWED_RE = re.compile(r"[^a-zA-ZÀ-ỹ0-9\s\.,!?:;\-…#]")
+
+
+def iter_text_blocks(f, block_chars: int = BLOCK_CHARS):
+    """Đọc file text theo khối ~block_chars ký tự, mỗi khối kết thúc ở ranh giới dòng."""
+    rest = ""
+    while True:
+        data = f.read(block_chars)
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind("\n") + 1
+        if cut == 0:
+            rest = data
+            continue
+        rest = data[cut:]
+        yield data[:cut]
+    if rest:
+        yield rest
+
+
+def clean_block(block: str) -> str:
+    """
+    Áp dụng các bước của clean_for_tts lên một khối gồm các dòng trọn vẹn.
+    Không pattern nào khớp qua "\n" nên làm theo khối cho kết quả như làm cả file;
+    bước nào không có ký tự kích hoạt trong khối thì được bỏ qua.
+    """
+    if not unicodedata.is_normalized("NFKC", block):
+        block = unicodedata.normalize("NFKC", block)
+    if "*" in block:
+        block = BOLD_RE.sub("", block)
+        block = ITALIC_RE.sub("", block)
+    block = BRACKETS_RE.sub("", block)
+    if "Camera" in block:
+        block = CAMERA_RE.sub("", block)
+    if "---" in block:
+        block = SEPARATOR_RE.sub("", block)
+    # str.split() tách theo đúng tập khoảng trắng của \s, nhanh hơn re.sub(r"\s+", " ")
+    return " ".join(DISALLOWED_RE.sub("", block).split())
+
+
+def iter_clean_blocks(blocks):
+    """
+    Làm sạch từng khối (vd. từ iter_text_blocks), bỏ khối rỗng.
+    Nối kết quả bằng " " được đúng clean_for_tts của cả văn bản.
+    """
+    for block in blocks:
+        cleaned = clean_block(block)
+        if cleaned:
+            yield cleaned
+
+
+def iter_chapters(pieces):
+    """
+    Tách chương trên luồng text đã làm sạch (các đoạn được nối bằng " "),
+    trả về từng (tiêu đề, nội dung) như split_text_by_chapters.
+    Mỗi cặp "#...#" là một tiêu đề; text trước tiêu đề đầu tiên bị bỏ.
+    """
+    title = None
+    in_title = False
+    title_buf = []
+    content_buf = []
+    first = True
+
+    for piece in pieces:
+        if not first:
+            (title_buf if in_title else content_buf).append(" ")
+        first = False
+        segments = piece.split("#")
+        for i, segment in enumerate(segments):
+            if i:
+                if in_title:
+                    # Chỉ khi "#" đóng tiêu đề mới chắc chắn chương trước đã kết thúc
+                    if title is not None:
+                        content = "".join(content_buf).strip()
+                        if content:
+                            yield title, content
+                    title = "".join(title_buf).strip()
+                    content_buf = []
+                else:
+                    title_buf = []
+                in_title = not in_title
+            (title_buf if in_title else content_buf).append(segment)
+
+    if title is None:
+        return
+    if in_title:
+        # Dấu "#" cuối không có cặp: regex cũ không khớp, phần còn lại thuộc chương trước
+        content_buf.append("#")
+        content_buf.extend(title_buf)
+    content = "".join(content_buf).strip()
+    if content:
+        yield title, content
+
+
+def clean_file(input_file: str, cleaned_file: str = None) -> tuple:
+    """
+    Đọc `input_file` theo khối, ghi text đã làm sạch ra `cleaned_file` (nếu có)
+    và tách chương trong cùng một lượt.
+    Trả về (danh sách (tiêu đề, nội dung), số ký tự sau làm sạch).
+    """
+    length = 0
+
+    def tee(pieces, out):
+        nonlocal length
+        for i, piece in enumerate(pieces):
+            if out:
+                out.write(" " + piece if i else piece)
+            length += len(piece) + (1 if i else 0)
+            yield piece
+
+    with open(input_file, "r", encoding="utf-8") as src:
+        out = open(cleaned_file, "w", encoding="utf-8") if cleaned_file else None
+        try:
+            chapters = list(iter_chapters(tee(iter_clean_blocks(iter_text_blocks(src)), out)))
+        finally:
+            if out:
+                out.close()
+    return chapters, length
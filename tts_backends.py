@@ -0,0 +1,297 @@
+"""
+Các engine TTS mà convert.py có thể dùng, chọn theo tên qua get_backend().
+
+Mỗi backend khai báo khả năng của mình để pipeline tự điều chỉnh:
+    streaming         trả audio theo từng chunk khi đang tổng hợp
+    word_boundaries   có timestamp từng từ (dựng phụ đề không cần Whisper)
+    max_request_chars độ dài text tối đa mỗi request
+    max_concurrency   số request chạy song song tối đa
+    requests_per_second giới hạn tốc độ gọi (None = không giới hạn)
+
+Có sẵn:
+    edge    edge-tts (cần mạng)
+    espeak  espeak-ng/espeak chạy local, chuyển sang MP3 bằng ffmpeg
+    tone    sinh tiếng bíp bằng ffmpeg, độ dài theo số từ; dùng để test/benchmark offline
+
+Benchmark không cần mạng:
+    python tts_backends.py tone 50
+"""
+import abc
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from media_probe import find_tool
+
+
+def attach_punctuation(words: list, text: str):
+    """Gắn lại dấu câu đứng sau mỗi từ (edge-tts bỏ dấu câu khỏi WordBoundary)."""
+    cursor = 0
+    for word in words:
+        index = text.find(word[2], cursor)
+        if index < 0:
+            continue
+        end = index + len(word[2])
+        while end < len(text) and not text[end].isspace():
+            end += 1
+        word[2] = text[index:end]
+        cursor = end
+
+
+def parse_rate(rate: str) -> float:
+    """"+20%" -> 1.2, "-10%" -> 0.9."""
+    try:
+        return max(0.1, 1 + float(rate.strip().rstrip("%")) / 100)
+    except ValueError:
+        return 1.0
+
+
+def boundary_word(chunk: dict) -> list:
+    """Sự kiện WordBoundary/SentenceBoundary -> [start_ms, end_ms, text] (edge-tts tính theo đơn vị 100ns)."""
+    start_ms = chunk["offset"] / 10000
+    return [start_ms, start_ms + chunk["duration"] / 10000, chunk["text"]]
+
+
+async def collect_stream(backend: "TTSBackend", text: str, voice: str, rate: str) -> tuple:
+    """Gom toàn bộ audio và word boundary của một đoạn từ backend.stream() vào bộ nhớ."""
+    data = bytearray()
+    words = []
+    async for chunk in backend.stream(text, voice, rate):
+        if chunk["type"] == "audio":
+            data.extend(chunk["data"])
+        elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
+            words.append(boundary_word(chunk))
+    attach_punctuation(words, text)
+    return bytes(data), words
+
+
+def save_words(words_path: str, words: list):
+    with open(words_path, "w", encoding="utf-8") as f:
+        json.dump(words, f, ensure_ascii=False)
+
+
+class TTSBackend(abc.ABC):
+    """
+    Giao diện chung. `synthesize` ghi MP3 ra `output_path` (và word boundary
+    [[start_ms, end_ms, text], ...] ra `words_path` nếu backend hỗ trợ), ném
+    exception khi lỗi để synthesize_with_retry thử lại.
+    """
+    name = "base"
+    streaming = False
+    word_boundaries = False
+    max_request_chars = 2000
+    max_concurrency = 4
+    requests_per_second = None
+
+    def cache_tag(self) -> tuple:
+        """Thêm vào cache key để audio của các backend khác nhau không lẫn vào nhau."""
+        return (self.name,)
+
+    @abc.abstractmethod
+    async def synthesize(self, text: str, output_path: str, voice: str, rate: str, words_path: str = None):
+        """Tổng hợp `text` ra file MP3 `output_path`."""
+
+    async def stream(self, text: str, voice: str, rate: str, chunk_bytes: int = 64 * 1024):
+        """
+        Trả về từng chunk {"type": "audio", "data"} / {"type": "WordBoundary", ...} như edge-tts.
+
+        Mặc định (backend có streaming=False): tổng hợp trọn đoạn ra file tạm
+        bằng synthesize rồi mới trả về, nên không có audio sớm hơn synthesize.
+        """
+        fd, output_path = tempfile.mkstemp(suffix=".mp3")
+        os.close(fd)
+        words_path = output_path + ".words.json" if self.word_boundaries else None
+        try:
+            await self.synthesize(text, output_path, voice, rate, words_path)
+            if words_path:
+                with open(words_path, "r", encoding="utf-8") as f:
+                    for start_ms, end_ms, word in json.load(f):
+                        # Cùng đơn vị 100ns với edge-tts (xem boundary_word)
+                        yield {"type": "WordBoundary", "offset": start_ms * 10000,
+                               "duration": (end_ms - start_ms) * 10000, "text": word}
+            with open(output_path, "rb") as f:
+                while True:
+                    data = f.read(chunk_bytes)
+                    if not data:
+                        break
+                    yield {"type": "audio", "data": data}
+        finally:
+            for path in (output_path, words_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+
+class EdgeTTSBackend(TTSBackend):
+    name = "edge"
+    streaming = True
+    word_boundaries = True
+    max_request_chars = 2000
+    max_concurrency = 8
+    requests_per_second = 1.0
+
+    def cache_tag(self) -> tuple:
+        # Giữ nguyên key của cache tạo trước khi có backend
+        return ()
+
+    def communicate(self, text: str, voice: str, rate: str, with_words: bool):
+        import edge_tts
+
+        if with_words:
+            try:
+                return edge_tts.Communicate(text=text, voice=voice, rate=rate, boundary="WordBoundary")
+            except TypeError:
+                # edge-tts cũ không có tham số boundary nhưng mặc định đã gửi WordBoundary
+                pass
+        return edge_tts.Communicate(text=text, voice=voice, rate=rate)
+
+    async def stream(self, text: str, voice: str, rate: str):
+        async for chunk in self.communicate(text, voice, rate, True).stream():
+            yield chunk
+
+    async def synthesize(self, text: str, output_path: str, voice: str, rate: str, words_path: str = None):
+        if words_path is None:
+            await self.communicate(text, voice, rate, False).save(output_path)
+            return
+
+        words = []
+        with open(output_path, "wb") as f:
+            async for chunk in self.stream(text, voice, rate):
+                if chunk["type"] == "audio":
+                    f.write(chunk["data"])
+                elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
+                    words.append(boundary_word(chunk))
+        attach_punctuation(words, text)
+        save_words(words_path, words)
+
+
+async def run_process(cmd: list, input_data: bytes = None):
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    _, stderr = await process.communicate(input_data)
+    if process.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(cmd[0])} lỗi: {stderr.decode('utf-8', errors='replace')[-300:]}")
+
+
+# Cùng định dạng với edge-tts (24kHz mono) để file của các backend nối frame được với nhau;
+# không ghi tag ID3/frame Xing để các đoạn có thể ghép byte như output của edge-tts
+MP3_ARGS = ["-ar", "24000", "-ac", "1", "-c:a", "libmp3lame", "-b:a", "48k",
+            "-write_xing", "0", "-id3v2_version", "0", "-f", "mp3"]
+
+
+class EspeakBackend(TTSBackend):
+    """espeak-ng (hoặc espeak) chạy local; voice là mã ngôn ngữ espeak, vd. "vi"."""
+    name = "espeak"
+    max_request_chars = 5000
+    max_concurrency = os.cpu_count() or 4
+
+    def __init__(self, default_voice: str = "vi"):
+        self.default_voice = default_voice
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak") or "espeak-ng"
+
+    async def synthesize(self, text: str, output_path: str, voice: str, rate: str, words_path: str = None):
+        # Giọng edge-tts (vd. vi-VN-NamMinhNeural) không có trong espeak, dùng mã ngôn ngữ
+        language = voice.split("-")[0] if voice and "Neural" in voice else (voice or self.default_voice)
+        words_per_minute = int(175 * parse_rate(rate))
+        fd, wav_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            await run_process(
+                [self.executable, "-v", language, "-s", str(words_per_minute), "-w", wav_path, "--stdin"],
+                text.encode("utf-8")
+            )
+            await run_process([find_tool("ffmpeg"), "-v", "error", "-i", wav_path, *MP3_ARGS, "-y", output_path])
+        finally:
+            os.remove(wav_path)
+
+
+class ToneBackend(TTSBackend):
+    """
+    Engine giả lập hoàn toàn offline và tất định: mỗi từ là WORD_MS tiếng bíp,
+    có word boundary tương ứng. Dùng cho CI, benchmark và load test pipeline.
+    """
+    name = "tone"
+    word_boundaries = True
+    max_request_chars = 10000
+    max_concurrency = os.cpu_count() or 4
+    WORD_MS = 300
+
+    async def synthesize(self, text: str, output_path: str, voice: str, rate: str, words_path: str = None):
+        word_ms = self.WORD_MS / parse_rate(rate)
+        words = []
+        for i, word in enumerate(text.split()):
+            words.append([i * word_ms, (i + 1) * word_ms, word])
+        duration = max(len(words), 1) * word_ms / 1000
+        await run_process([
+            find_tool("ffmpeg"), "-v", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=24000:duration={duration:.3f}",
+            *MP3_ARGS, "-y", output_path
+        ])
+        if words_path:
+            save_words(words_path, words)
+
+
+BACKENDS = {
+    "edge": EdgeTTSBackend,
+    "espeak": EspeakBackend,
+    "tone": ToneBackend,
+}
+
+
+def get_backend(backend="edge") -> TTSBackend:
+    """Nhận tên backend hoặc instance có sẵn."""
+    if isinstance(backend, TTSBackend):
+        return backend
+    try:
+        return BACKENDS[backend]()
+    except KeyError:
+        raise ValueError(f"Không có TTS backend '{backend}' (có: {', '.join(BACKENDS)})")
+
+
+def benchmark_backend(
+    backend="tone",
+    chapters: int = 20,
+    chapter_chars: int = 3000,
+    concurrency: int = 4,
+    log_func=print
+) -> dict:
+    """
+    Chạy synthesize_chapters với text sinh sẵn (không dùng cache) để đo thông
+    lượng ký tự/giây của pipeline với một backend.
+    """
+    from convert import synthesize_chapters
+
+    backend = get_backend(backend)
+    sentence = "Đây là một câu dùng để đo tốc độ tổng hợp giọng nói. "
+    text = (sentence * (chapter_chars // len(sentence) + 1))[:chapter_chars]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        jobs = [(f"Chương {i}", text, os.path.join(tmp_dir, f"part-{i:03d}.mp3")) for i in range(1, chapters + 1)]
+        start = time.perf_counter()
+        results = asyncio.run(synthesize_chapters(
+            jobs, concurrency=min(concurrency, backend.max_concurrency),
+            requests_per_second=backend.requests_per_second, log_func=lambda msg: None,
+            max_chunk_chars=backend.max_request_chars, backend=backend
+        ))
+        elapsed = time.perf_counter() - start
+
+    done = sum(1 for entry in results if entry)
+    total_chars = done * chapter_chars
+    log_func(f"⏱️ Backend '{backend.name}': {done}/{chapters} chương, {total_chars} ký tự trong {elapsed:.2f}s "
+             f"({total_chars / elapsed:.0f} ký tự/giây)")
+    return {"backend": backend.name, "chapters": done, "seconds": elapsed, "chars_per_second": total_chars / elapsed}
+
+
+if __name__ == "__main__":
+    import sys
+    # Dùng class của module tts_backends (convert import module này), không phải của __main__
+    from tts_backends import benchmark_backend
+
+    name = sys.argv[1] if len(sys.argv) > 1 else "tone"
+    benchmark_backend(name, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "text-to-speech")
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def make_cache_key(text: str, voice: str, rate: str, *extra: str) -> str:
+    """Hash nội dung (text, voice, rate) thành key cố định cho cache."""
+    h = hashlib.sha256()
+    for field in (text, voice, rate, *extra):
+        h.update(field.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class SynthesisCache:
+    """
+    Cache audio đã tổng hợp trên đĩa, đánh địa chỉ theo nội dung.
+
+    Mỗi entry là một file `<key>.mp3`; mtime được cập nhật khi đọc để làm
+    thứ tự LRU, và tổng dung lượng được giữ dưới `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, ext: str = ".mp3"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ext = ext
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key: str, suffix: str = None) -> str:
+        return os.path.join(self.cache_dir, key + (suffix or self.ext))
+
+    def get(self, key: str, dest_path: str, suffix: str = None) -> bool:
+        """
+        Copy entry ra `dest_path` nếu có trong cache.
+        `suffix` dùng cho file đi kèm cùng key (vd. word boundary); không tính vào thống kê.
+        """
+        path = self.path_for(key, suffix)
+        try:
+            atomic_copy(path, dest_path)
+            os.utime(path)
+        except OSError:
+            if suffix is None:
+                with self.lock:
+                    self.misses += 1
+            return False
+        if suffix is None:
+            with self.lock:
+                self.hits += 1
+        return True
+
+    def put(self, key: str, src_path: str, suffix: str = None):
+        """Lưu file vào cache (ghi atomic) rồi dọn bớt entry cũ nếu vượt giới hạn."""
+        try:
+            atomic_copy(src_path, self.path_for(key, suffix))
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self) -> str:
+        lookups = self.hits + self.misses
+        ratio = (self.hits / lookups * 100) if lookups else 0.0
+        return f"💾 Cache: {self.hits} hit / {self.misses} miss ({ratio:.0f}%)"
+
+
+def atomic_copy(src_path: str, dest_path: str):
+    """Copy qua file tạm cùng thư mục rồi os.replace, tránh file dở dang khi bị ngắt."""
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as dst, open(src_path, "rb") as src:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise